@@ -0,0 +1,81 @@
+"""age of death distributions from the single-year-of-age exports
+
+prep_age_deaths() and prep_covid() have a row per (month, gender, age). The
+deaths are counted into a (group x age) histogram with one weighted bincount,
+and the mean, median, any quantile or the whole distribution of each group
+are read off its cumulative sums:
+
+    hist = ages.age_histogram(wrangle.prep_age_deaths(), by=("month", "gender_code"))
+    ages.age_summary(hist)             # deaths, mean, median and quartiles
+    ages.age_distribution(hist)        # share of deaths at each age
+
+Ages are single years from 0 to MAX_AGE, the exports put everyone 100 and
+over at 100.
+"""
+
+import numpy as np
+import pandas as pd
+
+MAX_AGE = 100
+QUANTILES = [0.1, 0.25, 0.5, 0.75, 0.9]
+
+
+def age_histogram(df, by=("month",)):
+    """deaths at each age for each combination of by
+
+    returns a dict with the groups under "index", the ages under "ages" and
+    the deaths as a (group x age) array under "counts"
+    """
+    by = list(by)
+    if len(by) == 1:
+        codes, index = pd.factorize(df[by[0]], sort=True)
+        index = pd.Index(index, name=by[0])
+    else:
+        codes, index = pd.MultiIndex.from_frame(df[by]).factorize(sort=True)
+        index = pd.MultiIndex.from_tuples(index, names=by)
+    ages = np.clip(df["age"].to_numpy(), 0, MAX_AGE)
+    cells = codes * (MAX_AGE + 1) + ages
+    counts = np.bincount(
+        cells,
+        weights=df["deaths"].to_numpy(dtype="float64"),
+        minlength=len(index) * (MAX_AGE + 1),
+    ).reshape(len(index), MAX_AGE + 1)
+    return {"index": index, "ages": np.arange(MAX_AGE + 1), "counts": counts}
+
+
+def age_quantiles(hist, quantiles=QUANTILES):
+    """the age at each quantile of each group's deaths, as a (group x quantile) array
+
+    the quantile is the youngest age by which that share of the deaths happened
+    """
+    cumulative = np.cumsum(hist["counts"], axis=1)
+    totals = cumulative[:, -1:]
+    shares = np.asarray(quantiles)[None, :, None] * totals[:, :, None]
+    positions = (cumulative[:, None, :] < shares).sum(axis=2)
+    ages = hist["ages"][np.minimum(positions, MAX_AGE)].astype("float64")
+    ages[totals[:, 0] == 0] = np.nan
+    return ages
+
+
+def age_summary(hist, quantiles=QUANTILES):
+    """deaths, mean age and age quantiles of each group"""
+    counts = hist["counts"]
+    deaths = counts.sum(axis=1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        mean = counts @ hist["ages"] / deaths
+    summary = pd.DataFrame({"deaths": deaths, "mean_age": mean}, index=hist["index"])
+    for quantile, ages in zip(quantiles, age_quantiles(hist, quantiles).T):
+        name = "median_age" if quantile == 0.5 else "q{:g}_age".format(quantile * 100)
+        summary[name] = ages
+    return summary
+
+
+def age_distribution(hist, share=True):
+    """a row per group and a column per age, deaths or their share of the group"""
+    counts = hist["counts"]
+    if share:
+        with np.errstate(divide="ignore", invalid="ignore"):
+            counts = counts / counts.sum(axis=1, keepdims=True)
+    return pd.DataFrame(
+        counts, index=hist["index"], columns=pd.Index(hist["ages"], name="age")
+    )
@@ -0,0 +1,192 @@
+"""scan every (age_group, gender, cause) monthly series for deviations from 2018-2019
+
+Each cell of the cube is compared with the seasonal expectation of its
+series from the baseline years (excess.seasonal_expected), scaled by a robust
+spread: the median absolute deviation of the baseline residuals, floored at
+the Poisson spread of the expected count. Every month after the baseline gets
+a robust z-score and a two sided p-value, every series a combined shift test
+and two sided CUSUM alarms, and Benjamini-Hochberg q-values control the false
+discovery rate over all cells and over all series:
+
+    result = anomalies.scan()
+    anomalies.series_report(result)          # one row per series, most significant first
+    anomalies.to_frame(result)               # the flagged months of every series
+
+    python anomalies.py --fdr 0.05 --top 20
+
+All series are handled together as arrays over cube.AXES.
+"""
+
+import argparse
+
+import numpy as np
+import pandas as pd
+from scipy import stats
+
+import cube
+import excess
+
+FDR = 0.05
+MAD_SCALE = 1.4826  # MAD to standard deviation for normal data
+CUSUM_K = 0.5  # allowance, in robust standard deviations
+CUSUM_H = 5.0  # alarm threshold
+
+
+def benjamini_hochberg(p_values):
+    """Benjamini-Hochberg q-values of an array of p-values, nan ones are left out"""
+    p = np.asarray(p_values, dtype="float64")
+    q = np.full(p.shape, np.nan)
+    tested = ~np.isnan(p)
+    flat = p[tested]
+    order = np.argsort(flat)
+    ranked = flat[order] * len(flat) / np.arange(1, len(flat) + 1)
+    # the q-value of a p-value is the smallest adjusted value at or above it
+    ranked = np.minimum.accumulate(ranked[::-1])[::-1]
+    adjusted = np.empty(len(flat))
+    adjusted[order] = np.clip(ranked, 0, 1)
+    q[tested] = adjusted
+    return q
+
+
+def robust_scale(residuals, expected, baseline):
+    """spread of each series from the MAD of its baseline residuals
+
+    floored at the Poisson spread of the expected count, and at one death,
+    so quiet series don't get a spread of zero
+    """
+    past = residuals[baseline]
+    mad = np.median(np.abs(past - np.median(past, axis=0)), axis=0)
+    return np.sqrt(np.maximum((MAD_SCALE * mad) ** 2, np.maximum(expected, 1)))
+
+
+def cusum(z, k=CUSUM_K):
+    """upper and lower CUSUM statistics of z-scores along the month axis"""
+    upper = np.zeros(z.shape)
+    lower = np.zeros(z.shape)
+    high = np.zeros(z.shape[1:])
+    low = np.zeros(z.shape[1:])
+    for month in range(len(z)):
+        high = np.maximum(0, high + z[month] - k)
+        low = np.maximum(0, low - z[month] - k)
+        upper[month], lower[month] = high, low
+    return upper, lower
+
+
+def scan(data=None, fdr=FDR, k=CUSUM_K, h=CUSUM_H):
+    """robust z-scores, p-values, q-values and CUSUM of every cell of a cube
+
+    returns a cube with arrays over cube.AXES ("observed", "expected",
+    "scale", "z", "p_value", "q_value", "flagged", "cusum_upper",
+    "cusum_lower") and per series arrays over the other axes ("shift_z",
+    "shift_p", "shift_q", "alarm_up", "alarm_down"), the alarms being the
+    position of the first month the CUSUM passes h, -1 if it never does
+    """
+    if data is None:
+        data = cube.get_cube()
+    months = pd.DatetimeIndex(data["axes"]["month"])
+    deaths = np.asarray(data["deaths"], dtype="float64")
+    baseline = excess.baseline_months(months)
+    if not baseline.any():
+        raise ValueError("no months of {} in the data".format(excess.BASELINE_YEARS))
+    expected, _ = excess.seasonal_expected(deaths, months)
+    residuals = deaths - expected
+    scale = robust_scale(residuals, expected, baseline)
+    z = residuals / scale
+    # months after the baseline are tested, series without deaths aren't
+    monitored = months > months[baseline].max()
+    active = deaths.sum(axis=0) > 0
+    tested = monitored.reshape((-1,) + (1,) * (deaths.ndim - 1)) & active
+    p_values = np.where(tested, 2 * stats.norm.sf(np.abs(z)), np.nan)
+    q_values = benjamini_hochberg(p_values)
+    upper, lower = cusum(np.where(tested, z, 0), k)
+    # Stouffer's combination of the monitored months, a sustained shift
+    shift_z = z[monitored].sum(axis=0) / np.sqrt(max(monitored.sum(), 1))
+    shift_p = np.where(active, 2 * stats.norm.sf(np.abs(shift_z)), np.nan)
+    alarm_up, alarm_down = [
+        np.where((stat > h).any(axis=0), (stat > h).argmax(axis=0), -1)
+        for stat in [upper, lower]
+    ]
+    return {
+        "axes": data["axes"],
+        "observed": deaths,
+        "expected": expected,
+        "scale": scale,
+        "z": z,
+        "p_value": p_values,
+        "q_value": q_values,
+        "flagged": q_values <= fdr,
+        "cusum_upper": upper,
+        "cusum_lower": lower,
+        "shift_z": shift_z,
+        "shift_p": shift_p,
+        "shift_q": benjamini_hochberg(shift_p),
+        "alarm_up": alarm_up,
+        "alarm_down": alarm_down,
+        "fdr": fdr,
+    }
+
+
+def series_report(result, significant_only=True):
+    """one row per series: deaths, shift, its q-value, flagged months and alarms
+
+    sorted with the most significant shifts first
+    """
+    axes = cube.AXES[1:]
+    months = pd.DatetimeIndex(result["axes"]["month"])
+    monitored = months > months[excess.baseline_months(months)].max()
+
+    def alarm_month(position):
+        labels = months.to_numpy()[np.clip(position, 0, None)]
+        return np.where(position >= 0, labels, np.datetime64("NaT"))
+
+    report = pd.DataFrame(
+        {
+            "deaths": np.ravel(result["observed"].sum(axis=0)),
+            "expected": np.ravel(result["expected"][monitored].sum(axis=0)),
+            "observed_since": np.ravel(result["observed"][monitored].sum(axis=0)),
+            "shift_z": np.ravel(result["shift_z"]),
+            "shift_p": np.ravel(result["shift_p"]),
+            "shift_q": np.ravel(result["shift_q"]),
+            "flagged_months": np.ravel(result["flagged"].sum(axis=0)),
+            "alarm_up": np.ravel(alarm_month(result["alarm_up"])),
+            "alarm_down": np.ravel(alarm_month(result["alarm_down"])),
+        },
+        index=pd.MultiIndex.from_product(
+            [result["axes"][axis] for axis in axes], names=axes
+        ),
+    )
+    report["direction"] = np.where(report["shift_z"] > 0, "higher", "lower")
+    report = report[report["deaths"] > 0]
+    if significant_only:
+        report = report[report["shift_q"] <= result["fdr"]]
+    order = np.lexsort([-report["shift_z"].abs(), report["shift_q"]])
+    return report.iloc[order].reset_index()
+
+
+def to_frame(result, flagged_only=True):
+    """the tested cells as a tidy DataFrame, only the flagged ones by default"""
+    index = pd.MultiIndex.from_product(
+        [result["axes"][axis] for axis in cube.AXES], names=cube.AXES
+    )
+    measures = ["observed", "expected", "scale", "z", "p_value", "q_value"]
+    frame = pd.DataFrame(
+        {measure: np.ravel(result[measure]) for measure in measures}, index=index
+    )
+    frame["flagged"] = np.ravel(result["flagged"])
+    frame = frame[frame["p_value"].notna()]
+    if flagged_only:
+        frame = frame[frame["flagged"]]
+    return frame.reset_index()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--fdr", type=float, default=FDR)
+    parser.add_argument("--top", type=int, default=20)
+    parser.add_argument("--output", help="write every significant series to a csv")
+    args = parser.parse_args()
+    report = series_report(scan(fdr=args.fdr))
+    if args.output:
+        report.to_csv(args.output, index=False)
+    with pd.option_context("display.width", 200, "display.max_columns", None):
+        print(report.head(args.top))
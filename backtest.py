@@ -0,0 +1,189 @@
+"""rolling-origin backtests of forecasting models over the df2 series
+
+Every model is evaluated with an expanding window: from each origin (the
+number of months the model may see) it forecasts the next horizon months,
+for every origin and every series at once. The baselines work on the whole
+(month x series) array with NumPy, Holt-Winters included, since with fixed
+smoothing constants one pass over the months gives its state at every origin:
+
+    metrics = backtest.run(horizon=12)
+    metrics.loc[("seasonal_naive", "covid_deaths")]
+    backtest.best_models(metrics)
+
+Prophet can be added as a model with prophet_model(), it is fitted once per
+origin and series so it is much slower than the baselines.
+"""
+
+import inspect
+from functools import partial
+
+import numpy as np
+import pandas as pd
+
+import forecast
+import wrangle
+
+SEASON = 12  # months
+
+
+def last_value(values, origins, horizon):
+    """the last seen month, repeated"""
+    return np.repeat(values[origins - 1][:, None, :], horizon, axis=1)
+
+
+def simple_average(values, origins, horizon):
+    """the mean of every seen month"""
+    sums = np.vstack([np.zeros((1, values.shape[1])), np.cumsum(values, axis=0)])
+    means = sums[origins] / origins[:, None]
+    return np.repeat(means[:, None, :], horizon, axis=1)
+
+
+def moving_average(values, origins, horizon, window=3):
+    """the mean of the last window seen months"""
+    sums = np.vstack([np.zeros((1, values.shape[1])), np.cumsum(values, axis=0)])
+    means = (sums[origins] - sums[origins - window]) / window
+    return np.repeat(means[:, None, :], horizon, axis=1)
+
+
+def seasonal_naive(values, origins, horizon, season=SEASON):
+    """the same month of the last seen season"""
+    months = origins[:, None] - season + np.arange(horizon) % season
+    return values[months]
+
+
+def holt_winters(
+    values, origins, horizon, alpha=0.3, beta=0.05, gamma=0.2, season=SEASON
+):
+    """additive Holt-Winters with fixed smoothing constants
+
+    initialised from the first season only, so origins need at least one season
+    """
+    months, series = values.shape
+    level = np.full((months + 1, series), np.nan)
+    trend = np.full((months + 1, series), np.nan)
+    seasonal = np.full((months, series), np.nan)
+    # level[t] and trend[t] are the state after seeing the first t months
+    level[season] = values[:season].mean(axis=0)
+    trend[season] = 0
+    seasonal[:season] = values[:season] - level[season]
+    for t in range(season, months):
+        level[t + 1] = alpha * (values[t] - seasonal[t - season]) + (1 - alpha) * (
+            level[t] + trend[t]
+        )
+        trend[t + 1] = beta * (level[t + 1] - level[t]) + (1 - beta) * trend[t]
+        seasonal[t] = (
+            gamma * (values[t] - level[t + 1]) + (1 - gamma) * seasonal[t - season]
+        )
+    steps = np.arange(1, horizon + 1)
+    # latest seasonal estimate for the phase of each forecast month
+    phases = origins[:, None] - season + (steps - 1) % season
+    return (
+        level[origins][:, None, :]
+        + steps[None, :, None] * trend[origins][:, None, :]
+        + seasonal[phases]
+    )
+
+
+def prophet_model(index, seasonality_mode="additive"):
+    """a model fitting Prophet at every origin, index is the months of the series"""
+    if forecast.Prophet is None:
+        raise ImportError("the prophet model needs prophet, pip install prophet")
+
+    def model(values, origins, horizon):
+        forecasts = np.full((len(origins), horizon, values.shape[1]), np.nan)
+        for i, origin in enumerate(origins):
+            for j in range(values.shape[1]):
+                train = pd.DataFrame({"ds": index[:origin], "y": values[:origin, j]})
+                fitted = forecast.Prophet(seasonality_mode=seasonality_mode)
+                fitted = fitted.fit(train)
+                future = fitted.make_future_dataframe(periods=horizon, freq="MS")
+                forecasts[i, :, j] = fitted.predict(future)["yhat"].to_numpy()[origin:]
+        return forecasts
+
+    return model
+
+
+MODELS = {
+    "last_value": last_value,
+    "simple_average": simple_average,
+    "moving_average": partial(moving_average, window=3),
+    "seasonal_naive": seasonal_naive,
+    "holt_winters": holt_winters,
+}
+
+
+def history_needed(model):
+    """months a model needs to have seen, its window or season, at least a season
+
+    with fewer the negative indices of the baselines would wrap around to the
+    end of the series and forecast from months after the origin
+    """
+    try:
+        parameters = inspect.signature(model).parameters
+    except (TypeError, ValueError):
+        return SEASON
+    needed = [
+        parameters[name].default
+        for name in ["window", "season"]
+        if name in parameters and isinstance(parameters[name].default, int)
+    ]
+    return max([SEASON] + needed)
+
+
+def forecast_cube(values, models, horizon, min_train):
+    """forecasts of every model as arrays of (origin, horizon, series), and the actuals"""
+    needed = max(history_needed(model) for model in models.values())
+    if min_train < needed:
+        raise ValueError(
+            "min_train is {} but the models need {} months".format(min_train, needed)
+        )
+    origins = np.arange(min_train, len(values) - horizon + 1)
+    if len(origins) == 0:
+        raise ValueError("not enough months for min_train and horizon")
+    months = origins[:, None] + np.arange(horizon)
+    forecasts = {
+        name: model(values, origins, horizon) for name, model in models.items()
+    }
+    return forecasts, values[months], origins
+
+
+def run(df2=None, targets=None, models=None, horizon=SEASON, min_train=2 * SEASON):
+    """rolling-origin backtest of models over the target series of df2
+
+    models maps a name to a function (values, origins, horizon) -> forecasts,
+    MODELS by default. returns the metrics cube, a DataFrame of rmse, mae and
+    the number of origins indexed by (model, series, horizon)
+    """
+    if df2 is None:
+        df2 = wrangle.get_df_only()
+    if targets is None:
+        targets = forecast.target_columns(df2)
+    if models is None:
+        models = MODELS
+    values = df2[targets].to_numpy(dtype="float64")
+    forecasts, actuals, origins = forecast_cube(values, models, horizon, min_train)
+    index = pd.MultiIndex.from_product(
+        [list(models), targets, np.arange(1, horizon + 1)],
+        names=["model", "series", "horizon"],
+    )
+    errors = np.stack([forecasts[name] - actuals for name in models])
+    # (model, origin, horizon, series) -> (model, series, horizon, origin)
+    errors = errors.transpose(0, 3, 2, 1)
+    return pd.DataFrame(
+        {
+            "rmse": np.sqrt(np.nanmean(errors**2, axis=-1)).ravel(),
+            "mae": np.nanmean(np.abs(errors), axis=-1).ravel(),
+            "origins": np.isfinite(errors).sum(axis=-1).ravel(),
+        },
+        index=index,
+    )
+
+
+def best_models(metrics, metric="rmse", horizon=None):
+    """the best model per series by metric, averaged over horizons unless one is given"""
+    if horizon is not None:
+        scores = metrics.xs(horizon, level="horizon")[metric]
+    else:
+        scores = metrics[metric].groupby(level=["model", "series"]).mean()
+    scores = scores.unstack("model")
+    return pd.DataFrame({"model": scores.idxmin(axis=1), metric: scores.min(axis=1)})
@@ -0,0 +1,418 @@
+"""benchmarks of the wrangle and viz stages on synthetic WONDER exports
+
+Writes exports with the same layout as the CDC WONDER files (yearly
+"Provisional Mortality Statistics" exports, population, covid and age deaths
+by single year of age) at a multiple of the current size into a temporary
+folder, then times every stage there and measures its peak memory. Each run
+is appended to a JSON history and compared with the previous runs of the same
+stage and scale, slower or bigger runs are flagged as regressions:
+
+    python benchmark.py                       # 1x, 10x and 100x
+    python benchmark.py --scales 1 --no-viz --repeat 5
+    python benchmark.py --strict              # exit 1 on a regression
+
+Scaling multiplies the number of causes in the yearly exports and the rows of
+the single-year-of-age exports, the months and age groups stay the same.
+"""
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import tempfile
+import time
+import tracemalloc
+import warnings
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+import render  # sets the Agg backend before viz draws anything
+import snapshot
+import viz
+import wrangle
+
+HISTORY_FILE = os.path.join(".benchmarks", "history.json")
+SCALES = [1, 10, 100]
+REPEAT = 3
+TOLERANCE = 0.2  # slower or bigger than this fraction of the recent median
+MIN_DELTA = 0.005  # seconds, ignore changes smaller than this
+RECENT = 5  # previous runs the median is taken over
+
+AGE_GROUPS = [
+    ("< 1 year", "1"),
+    ("1-4 years", "1-4"),
+    ("5-14 years", "5-14"),
+    ("15-24 years", "15-24"),
+    ("25-34 years", "25-34"),
+    ("35-44 years", "35-44"),
+    ("45-54 years", "45-54"),
+    ("55-64 years", "55-64"),
+    ("65-74 years", "65-74"),
+    ("75-84 years", "75-84"),
+    ("85+ years", "85+"),
+]
+GENDERS = [("Female", "F"), ("Male", "M")]
+# causes the report picks out by name, the rest are made up per scale
+NAMED_CAUSES = [
+    ("#COVID-19 (U07.1)", "GR113-137"),
+    ("#Diseases of heart (I00-I09,I11,I13,I20-I51)", "GR113-054"),
+    ("#Assault (homicide) (*U01-*U02,X85-Y09,Y87.1)", "GR113-127"),
+    ("#Intentional self-harm (suicide) (*U03,X60-X84,Y87.0)", "GR113-124"),
+    ("#Diabetes mellitus (E10-E14)", "GR113-046"),
+    ("#Accidents (unintentional injuries) (V01-X59,Y85-Y86)", "GR113-112"),
+]
+CAUSES_PER_SCALE = 57  # about the number of causes in the real exports
+LAG_CAUSE = (
+    "Data not shown due to 6 month lag to account for delays in death "
+    "certificate completion for certain causes of death (999)",
+    "GR113-999",
+)
+FIRST_MONTH, LAST_MONTH = "2018-01", "2022-03"
+FOOTER = [
+    '"---"',
+    '"Dataset: Provisional Mortality Statistics, 2018 through Last Month"',
+    '"---"',
+]
+
+
+def month_labels(months):
+    """WONDER's month label and code, e.g. "Jan., 2018" and "2018/01" """
+    labels = [month.strftime("%b., %Y") for month in months]
+    codes = [month.strftime("%Y/%m") for month in months]
+    return labels, codes
+
+
+def causes(scale):
+    """the named causes plus made up ones, some without the "#" of a main group"""
+    made_up = []
+    for i in range(CAUSES_PER_SCALE * scale - len(NAMED_CAUSES)):
+        prefix = "#" if i % 3 else ""
+        made_up.append(
+            (
+                "{}Synthetic cause {} (X{:02d})".format(prefix, i, i % 100),
+                "GR113-{}".format(200 + i),
+            )
+        )
+    return NAMED_CAUSES + made_up
+
+
+def write_table(path, df):
+    """tab separated like WONDER, with its notes footer"""
+    df.to_csv(path, sep="\t", index=False)
+    with open(path, "a") as file:
+        file.write("\n".join(FOOTER) + "\n")
+
+
+def write_exports(folder, scale, seed=0):
+    """write a full set of synthetic source files at scale times the usual size"""
+    rng = np.random.default_rng(seed)
+    months = pd.period_range(FIRST_MONTH, LAST_MONTH, freq="M")
+    month_names, month_codes = month_labels(months)
+    cause_list = causes(scale)
+    # yearly exports, a row per (age group, gender, month, cause)
+    grid = pd.MultiIndex.from_product(
+        [
+            range(len(AGE_GROUPS)),
+            range(len(GENDERS)),
+            range(len(months)),
+            range(len(cause_list)),
+        ]
+    ).to_frame(index=False, name=["age", "gender", "month", "cause"])
+    df = pd.DataFrame(
+        {
+            "Notes": "",
+            "Ten-Year Age Groups": np.array([a for a, _ in AGE_GROUPS])[grid["age"]],
+            "Ten-Year Age Groups Code": np.array([c for _, c in AGE_GROUPS])[
+                grid["age"]
+            ],
+            "Gender": np.array([g for g, _ in GENDERS])[grid["gender"]],
+            "Gender Code": np.array([c for _, c in GENDERS])[grid["gender"]],
+            "Month": np.array(month_names)[grid["month"]],
+            "Month Code": np.array(month_codes)[grid["month"]],
+            "UCD - ICD-10 113 Cause List": np.array([c for c, _ in cause_list])[
+                grid["cause"]
+            ],
+            "UCD - ICD-10 113 Cause List Code": np.array([c for _, c in cause_list])[
+                grid["cause"]
+            ],
+            "Deaths": rng.poisson(200, len(grid)) + 10,
+            "Population": "Not Applicable",
+            "Crude Rate": "Not Applicable",
+        }
+    )
+    # the last six months have lag rows like the real exports
+    lagged = grid["month"] >= len(months) - 6
+    df.loc[
+        lagged & (grid["cause"] == len(cause_list) - 1), "UCD - ICD-10 113 Cause List"
+    ] = LAG_CAUSE[0]
+    years = df["Month Code"].str[:4]
+    for year in years.unique():
+        path = os.path.join(
+            folder, "Provisional Mortality Statistics, {}.txt".format(year)
+        )
+        write_table(path, df[years == year])
+    # population by year, age group and gender, with the "NS" rows WONDER adds
+    rows = []
+    for year in sorted(years.unique()):
+        # recent years are labelled like "2021 (provisional)"
+        label = year if year < "2021" else year + " (provisional)"
+        for age, code in AGE_GROUPS + [("Not Stated", "NS")]:
+            for gender, gender_code in GENDERS:
+                population = (
+                    "Not Applicable"
+                    if code == "NS"
+                    else int(rng.integers(1_000_000, 25_000_000))
+                )
+                rows.append(
+                    [
+                        "",
+                        label,
+                        year,
+                        age,
+                        code,
+                        gender,
+                        gender_code,
+                        1000,
+                        population,
+                        "1.0",
+                    ]
+                )
+    write_table(
+        os.path.join(folder, wrangle.POPULATION_FILE),
+        pd.DataFrame(
+            rows,
+            columns=[
+                "Notes",
+                "Year",
+                "Year Code",
+                "Ten-Year Age Groups",
+                "Ten-Year Age Groups Code",
+                "Gender",
+                "Gender Code",
+                "Deaths",
+                "Population",
+                "Crude Rate",
+            ],
+        ),
+    )
+    # single year of age exports, scaled by repeating every row
+    ages = (
+        [("< 1 year", "0")]
+        + [("{} years".format(a), str(a)) for a in range(1, 100)]
+        + [("100+ years", "100")]
+    )
+    grid = pd.MultiIndex.from_product(
+        [range(len(ages)), range(len(months)), range(len(GENDERS)), range(scale)]
+    ).to_frame(index=False, name=["age", "month", "gender", "copy"])
+    single = pd.DataFrame(
+        {
+            "Notes": "",
+            "Single-Year Ages": np.array([a for a, _ in ages])[grid["age"]],
+            "Single-Year Ages Code": np.array([c for _, c in ages])[grid["age"]],
+            "Month": np.array(month_names)[grid["month"]],
+            "Month Code": np.array(month_codes)[grid["month"]],
+            "Gender": np.array([g for g, _ in GENDERS])[grid["gender"]],
+            "Gender Code": np.array([c for _, c in GENDERS])[grid["gender"]],
+        }
+    )
+    covid = single[grid["month"] >= 24].copy()
+    covid.insert(7, "UCD - ICD-10 113 Cause List", NAMED_CAUSES[0][0])
+    covid.insert(8, "UCD - ICD-10 113 Cause List Code", NAMED_CAUSES[0][1])
+    for table, file in [(covid, wrangle.COVID_FILE), (single, wrangle.AGE_DEATHS_FILE)]:
+        table = table.assign(
+            Deaths=rng.poisson(50, len(table)) + 10,
+            Population="Not Applicable",
+        )
+        table["Crude Rate"] = "Not Applicable"
+        write_table(os.path.join(folder, file), table)
+
+
+def stages(viz_figures=True):
+    """name -> (function, cold), cold stages start with empty caches and snapshots"""
+    found = {
+        "wrangle_data": (wrangle.wrangle_data, True),
+        "prep_covid": (wrangle.prep_covid, True),
+        "prep_age_deaths": (wrangle.prep_age_deaths, True),
+        "get_monthly_deaths": (wrangle.get_monthly_deaths, False),
+        "make_df2": (wrangle.make_df2, False),
+    }
+    if snapshot.pa is not None:
+        found["wrangle_data_snapshot"] = (wrangle.wrangle_data, "snapshot")
+    if viz_figures:
+        for name in render.FIGURES:
+            found["viz." + name] = (getattr(viz, name), False)
+    return found
+
+
+def prepare(func, cold):
+    """get the caches into the state the stage is measured in"""
+    if cold is True:
+        wrangle.clear_cache()
+        snapshot.clear_snapshots()
+    elif cold == "snapshot":
+        func()  # make sure the snapshot exists, then forget the frame
+        wrangle.clear_cache()
+
+
+def call(func):
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        func()
+    render.plt.close("all")
+
+
+def measure(func, cold, repeat):
+    """best wall time of repeat runs, then the peak traced memory of one more"""
+    seconds = []
+    for _ in range(repeat):
+        prepare(func, cold)
+        start = time.perf_counter()
+        call(func)
+        seconds.append(time.perf_counter() - start)
+    prepare(func, cold)
+    tracemalloc.start()
+    try:
+        call(func)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return {"seconds": min(seconds), "peak_mb": peak / 2**20}
+
+
+def run_scale(scale, repeat=REPEAT, viz_figures=True, only=None):
+    """time every stage on synthetic exports at scale"""
+    results = {}
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as folder:
+        write_exports(folder, scale)
+        os.chdir(folder)  # wrangle reads its files from the working directory
+        try:
+            wrangle.clear_cache()
+            for name, (func, cold) in stages(viz_figures).items():
+                if only and name not in only:
+                    continue
+                if not cold:
+                    call(func)  # warm the caches it reads from
+                results[name] = measure(func, cold, repeat)
+        finally:
+            os.chdir(cwd)
+            wrangle.clear_cache()
+    return results
+
+
+def load_history(path):
+    if not os.path.exists(path):
+        return []
+    with open(path) as file:
+        return json.load(file)
+
+
+def regressions(history, scale, results, tolerance=TOLERANCE):
+    """stages slower or using more memory than the median of the recent runs"""
+    flagged = []
+    previous = [run for run in history if run["scale"] == scale][-RECENT:]
+    for stage, result in results.items():
+        past = [run["results"][stage] for run in previous if stage in run["results"]]
+        if not past:
+            continue
+        for metric, floor in [("seconds", MIN_DELTA), ("peak_mb", 1.0)]:
+            median = float(np.median([entry[metric] for entry in past]))
+            if (
+                result[metric] > median * (1 + tolerance)
+                and result[metric] - median > floor
+            ):
+                flagged.append(
+                    {
+                        "stage": stage,
+                        "metric": metric,
+                        "median": median,
+                        "value": result[metric],
+                    }
+                )
+    return flagged
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(
+    scales=SCALES,
+    repeat=REPEAT,
+    viz_figures=True,
+    only=None,
+    history_file=HISTORY_FILE,
+    tolerance=TOLERANCE,
+):
+    """benchmark every scale, append the runs to the history, returns the runs"""
+    history = load_history(history_file)
+    runs = []
+    for scale in scales:
+        results = run_scale(scale, repeat, viz_figures, only)
+        runs.append(
+            {
+                "time": datetime.now().isoformat(timespec="seconds"),
+                "commit": git_commit(),
+                "python": platform.python_version(),
+                "pandas": pd.__version__,
+                "numpy": np.__version__,
+                "scale": scale,
+                "results": results,
+                "regressions": regressions(history, scale, results, tolerance),
+            }
+        )
+    folder = os.path.dirname(history_file)
+    if folder:
+        os.makedirs(folder, exist_ok=True)
+    with open(history_file, "w") as file:
+        json.dump(history + runs, file, indent=1)
+    return runs
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scales", type=int, nargs="+", default=SCALES)
+    parser.add_argument("--repeat", type=int, default=REPEAT)
+    parser.add_argument("--stages", nargs="+", help="only these stages")
+    parser.add_argument("--no-viz", action="store_true", help="skip the viz figures")
+    parser.add_argument("--history", default=HISTORY_FILE)
+    parser.add_argument("--tolerance", type=float, default=TOLERANCE)
+    parser.add_argument("--strict", action="store_true", help="exit 1 on a regression")
+    args = parser.parse_args()
+    runs = run(
+        args.scales,
+        args.repeat,
+        not args.no_viz,
+        args.stages,
+        args.history,
+        args.tolerance,
+    )
+    flagged = False
+    for entry in runs:
+        print("scale {}x".format(entry["scale"]))
+        for stage, result in entry["results"].items():
+            print(
+                "  {:<48} {:>9.4f}s {:>9.1f} MB".format(
+                    stage, result["seconds"], result["peak_mb"]
+                )
+            )
+        for regression in entry["regressions"]:
+            flagged = True
+            print(
+                "  REGRESSION {stage} {metric}: {value:.4f} vs median {median:.4f}".format(
+                    **regression
+                )
+            )
+    if flagged and args.strict:
+        raise SystemExit(1)
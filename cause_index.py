@@ -0,0 +1,208 @@
+"""index of the merged table's rows by cause code and ICD-10 range
+
+Selecting causes with df["cause"].str.contains(...) scans every row and
+matches on display text. The index is built once per version of the source
+files from the "UCD - ICD-10 113 Cause List Code" (GR113-xxx) of each row and
+the ICD-10 ranges in the cause label, and resolves a code, an ICD-10 chapter,
+an ICD-10 code or a keyword to row positions directly:
+
+    index = get_cause_index()
+    df = wrangle.wrangle_data()
+    covid = select(df, index, code=COVID_CODE)
+    circulatory = select(df, index, chapter="IX")
+    flu = select(df, index, icd="J10")
+
+The index is snapshotted next to the cleaned tables.
+"""
+
+import hashlib
+import re
+
+import numpy as np
+import pandas as pd
+
+import snapshot
+import wrangle
+
+COVID_CODE = "GR113-137"
+
+# ICD-10 chapters and the codes they span
+CHAPTERS = {
+    "I": ("A00", "B99"),
+    "II": ("C00", "D48"),
+    "III": ("D50", "D89"),
+    "IV": ("E00", "E90"),
+    "V": ("F00", "F99"),
+    "VI": ("G00", "G99"),
+    "VII": ("H00", "H59"),
+    "VIII": ("H60", "H95"),
+    "IX": ("I00", "I99"),
+    "X": ("J00", "J99"),
+    "XI": ("K00", "K93"),
+    "XII": ("L00", "L99"),
+    "XIII": ("M00", "M99"),
+    "XIV": ("N00", "N99"),
+    "XV": ("O00", "O99"),
+    "XVI": ("P00", "P96"),
+    "XVII": ("Q00", "Q99"),
+    "XVIII": ("R00", "R99"),
+    "XIX": ("S00", "T98"),
+    "XX": ("V01", "Y98"),
+    "XXII": ("U00", "U99"),
+}
+
+
+def icd_key(code, end=False):
+    """comparable form of an ICD-10 code, a range end covers all its subcodes"""
+    code = code.strip().lstrip("*")
+    if "." not in code:
+        code += ".9" if end else ".0"
+    return code
+
+
+def icd_ranges(label):
+    """the ICD-10 ranges listed in a cause label, e.g. "(I00-I09,I11)" """
+    found = re.search(r"\(([^()]*)\)\s*$", label)
+    if found is None:
+        return []
+    ranges = []
+    for part in found.group(1).split(","):
+        start, _, stop = part.partition("-")
+        if not re.match(r"^\s*\*?[A-Z]\d", start):
+            continue
+        ranges.append((icd_key(start), icd_key(stop or start, end=True)))
+    return ranges
+
+
+def icd_chapters(ranges):
+    """the ICD-10 chapters the ranges fall in"""
+    chapters = []
+    for chapter, (first, last) in CHAPTERS.items():
+        first, last = icd_key(first), icd_key(last, end=True)
+        if any(start <= last and first <= stop for start, stop in ranges):
+            chapters.append(chapter)
+    return chapters
+
+
+def build_cause_index(df):
+    """index of df's rows by cause code
+
+    row positions are sorted by cause code so the rows of any code are one
+    contiguous slice of "rows", from "start" to "stop" in "causes"
+    """
+    codes, labels = pd.factorize(df["cause_code"], sort=True)
+    codes = codes.astype("int32")
+    rows = np.argsort(codes, kind="stable").astype("int32")
+    bounds = np.searchsorted(codes[rows], np.arange(len(labels) + 1))
+    causes = pd.DataFrame({"code": np.asarray(labels, dtype=object)})
+    # the label of each code, from its first row
+    causes["cause"] = df["cause"].to_numpy()[rows[bounds[:-1]]].astype(str)
+    ranges = causes["cause"].map(icd_ranges)
+    causes["icd"] = ranges.map(lambda r: ",".join(a + "-" + b for a, b in r))
+    causes["chapters"] = ranges.map(lambda r: ",".join(icd_chapters(r)))
+    causes["start"] = bounds[:-1]
+    causes["stop"] = bounds[1:]
+    return with_lookups(rows, causes)
+
+
+def codes_fingerprint(codes):
+    """digest of a cause code column in row order, the same for object and category"""
+    hashes = pd.util.hash_pandas_object(pd.Series(codes), index=False)
+    return hashlib.sha1(hashes.to_numpy().tobytes()).hexdigest()
+
+
+def with_lookups(rows, causes):
+    """the index dict, with plain python lookups so queries skip pandas
+
+    "fingerprint" is the codes_fingerprint() of the table the index was built
+    for, rebuilt from the rows of each code
+    """
+    entries = {}
+    codes = np.empty(len(rows), dtype=object)
+    for cause in causes.itertuples(index=False):
+        codes[rows[cause.start : cause.stop]] = cause.code
+        entries[cause.code] = {
+            "cause": cause.cause,
+            "lower": cause.cause.lower(),
+            "icd": [tuple(part.split("-")) for part in cause.icd.split(",") if part],
+            "chapters": cause.chapters.split(","),
+            "rows": slice(int(cause.start), int(cause.stop)),
+        }
+    rows.flags.writeable = False
+    return {
+        "rows": rows,
+        "causes": causes,
+        "entries": entries,
+        "size": len(rows),
+        "fingerprint": codes_fingerprint(codes),
+    }
+
+
+@wrangle.cached(lambda: wrangle.list_files(".") + [wrangle.POPULATION_FILE])
+def get_cause_index():
+    """the cause index of wrangle_data(), loaded from its snapshot when fresh"""
+    fingerprint = wrangle.file_fingerprint(
+        wrangle.list_files(".") + [wrangle.POPULATION_FILE]
+    )
+    rows = snapshot.load_snapshot("cause_index/rows", fingerprint)
+    causes = snapshot.load_snapshot("cause_index/causes", fingerprint)
+    if rows is not None and causes is not None:
+        return with_lookups(rows["rows"].to_numpy(), causes)
+    index = build_cause_index(wrangle.wrangle_data())
+    snapshot.save_snapshot(
+        "cause_index/rows", pd.DataFrame({"rows": index["rows"]}), fingerprint
+    )
+    snapshot.save_snapshot("cause_index/causes", index["causes"], fingerprint)
+    return index
+
+
+def matching_codes(index, code=None, chapter=None, icd=None, keyword=None):
+    """cause codes meeting every given criterion, resolved over distinct causes"""
+    entries = index["entries"]
+    if code is None:
+        codes = list(entries)
+    else:
+        codes = [code] if isinstance(code, str) else list(code)
+        codes = [code for code in codes if code in entries]
+    if chapter is not None:
+        codes = [code for code in codes if chapter in entries[code]["chapters"]]
+    if icd is not None:
+        start, stop = icd_key(icd), icd_key(icd, end=True)
+        codes = [
+            code
+            for code in codes
+            if any(a <= stop and start <= b for a, b in entries[code]["icd"])
+        ]
+    if keyword is not None:
+        keyword = keyword.lower()
+        codes = [code for code in codes if keyword in entries[code]["lower"]]
+    return codes
+
+
+def positions(index, **criteria):
+    """sorted row positions of the causes matching criteria, see matching_codes()
+
+    the cost is proportional to the number of matching rows
+    """
+    slices = [
+        index["rows"][index["entries"][code]["rows"]]
+        for code in matching_codes(index, **criteria)
+    ]
+    if not slices:
+        return np.array([], dtype="int32")
+    if len(slices) == 1:
+        return np.sort(slices[0])
+    return np.sort(np.concatenate(slices))
+
+
+def select(df, index, **criteria):
+    """the rows of df (as returned by wrangle_data()) matching criteria
+
+    df has to hold the same cause codes in the same order as the table the
+    index was built for
+    """
+    if len(df) != index["size"] or (
+        codes_fingerprint(df["cause_code"]) != index["fingerprint"]
+    ):
+        raise ValueError("cause index was built for a different table")
+    return df.iloc[positions(index, **criteria)]
@@ -0,0 +1,154 @@
+"""precomputed aggregate cube over the merged mortality table
+
+The merged table is summed once into dense NumPy arrays over
+(month, age_group, gender, cause), so the pivots viz.py builds, and roll-ups
+of them, come from slicing and summing a few thousand cells instead of the
+row-level table:
+
+    cube = get_cube()
+    covid = matching(cube, "cause", "COVID-19")
+    query(cube, by=("month", "age_group"), cause=covid)
+    query(cube, by=("month", "age_group"), cause=covid,
+          groups={"age_group": {"65+": ["65-74", "75-84", "85+"]}})
+    query(cube, "rate", by=("month",), age_group="85+")
+"""
+
+import numpy as np
+import pandas as pd
+
+import wrangle
+
+AXES = ["month", "age_group", "gender", "cause"]
+# population doesn't vary by cause, so it is kept without the cause axis
+POPULATION_AXES = ["month", "age_group", "gender"]
+
+
+def build_cube(df, population=None):
+    """sum deaths and crude_rate of df into arrays over AXES
+
+    returns a dict with the labels of each axis under "axes" and one array per
+    measure, "population" holds the population of each (month, age_group, gender)
+    from the population table (wrangle.prep_pop_data), read from
+    POPULATION_FILE when not given
+    """
+    axes = {}
+    codes = []
+    for axis in AXES:
+        axis_codes, labels = pd.factorize(df[axis], sort=True)
+        axes[axis] = pd.Index(np.asarray(labels), name=axis)
+        codes.append(axis_codes)
+    shape = tuple(len(axes[axis]) for axis in AXES)
+    # a flat cell number per row, then one bincount per measure
+    cells = np.ravel_multi_index(codes, shape)
+    cube = {"axes": axes}
+    for measure in ["deaths", "crude_rate"]:
+        cube[measure] = np.bincount(
+            cells,
+            weights=df[measure].to_numpy(dtype="float64"),
+            minlength=np.prod(shape),
+        ).reshape(shape)
+    cube["population"] = population_array(population, axes)
+    # the arrays are shared between callers of get_cube(), keep them read only
+    for measure in ["deaths", "crude_rate", "population"]:
+        cube[measure].flags.writeable = False
+    return cube
+
+
+def population_array(population, axes):
+    """population of every (month, age_group, gender) of the axes
+
+    every cell of the product gets its estimate, also the ones without any
+    deaths, groups without an estimate are 0
+    """
+    if population is None:
+        population = wrangle.prep_pop_data(wrangle.get_population())
+    table = wrangle.monthly_population(population, axes["month"])
+    values = np.zeros(tuple(len(axes[axis]) for axis in POPULATION_AXES))
+    positions = [
+        table["axes"][axis].get_indexer(axes[axis]) for axis in POPULATION_AXES
+    ]
+    found = [position >= 0 for position in positions]
+    cells = np.ix_(*[position[mask] for position, mask in zip(positions, found)])
+    values[np.ix_(*found)] = np.clip(table["population"][cells], 0, None)
+    return values
+
+
+@wrangle.cached(lambda: wrangle.list_files(".") + [wrangle.POPULATION_FILE])
+def get_cube():
+    """the cube of wrangle_data(), built once per version of the source files"""
+    return build_cube(wrangle.wrangle_data())
+
+
+def matching(cube, axis, text):
+    """labels of an axis containing text, e.g. matching(cube, "cause", "heart")"""
+    labels = cube["axes"][axis]
+    return list(labels[labels.astype(str).str.contains(text, regex=False)])
+
+
+def _select(cube, measure, axes, filters, groups):
+    """slice the measure's array by filters, then apply roll-up groups"""
+    values = cube[measure]
+    labels = []
+    for position, axis in enumerate(axes):
+        index = cube["axes"][axis]
+        if axis in filters:
+            wanted = filters[axis]
+            if isinstance(wanted, str) or not np.iterable(wanted):
+                wanted = [wanted]
+            positions = index.get_indexer(wanted)
+            if (positions < 0).any():
+                raise KeyError("unknown {} in cube: {}".format(axis, wanted))
+            values = values.take(positions, axis=position)
+            index = index[positions]
+        if axis in groups:
+            # membership matrix of labels x groups, summed along the axis
+            names = list(groups[axis])
+            members = np.zeros((len(index), len(names)))
+            for column, name in enumerate(names):
+                members[index.isin(groups[axis][name]), column] = 1
+            values = np.moveaxis(
+                np.tensordot(values, members, axes=([position], [0])), -1, position
+            )
+            index = pd.Index(names, name=axis)
+        labels.append(index)
+    return values, labels
+
+
+def query(cube, measure="deaths", by=("month",), groups=None, **filters):
+    """sum a measure over every axis not in by, after filtering and roll-ups
+
+    measure is "deaths", "crude_rate" (summed like the viz.py pivots),
+    "population", or "rate" for deaths divided by the population of the same
+    selection. filters pick labels of an axis, e.g. gender="Male" or
+    cause=[...], groups maps an axis to {new label: [labels]} roll-ups.
+    one axis in by gives a Series, two a DataFrame like pivot_table, more a
+    Series with a MultiIndex
+    """
+    groups = groups or {}
+    by = list(by)
+    if measure == "rate":
+        if "cause" in by or "cause" in groups:
+            raise ValueError("population does not vary by cause")
+        deaths = query(cube, "deaths", by, groups, **filters)
+        filters.pop("cause", None)
+        return deaths / query(cube, "population", by, groups, **filters)
+    axes = POPULATION_AXES if measure == "population" else AXES
+    missing = [axis for axis in by if axis not in axes]
+    if missing:
+        raise KeyError("{} has no axis {}".format(measure, missing))
+    values, labels = _select(cube, measure, axes, filters, groups)
+    # sum away every other axis, then put the remaining ones in the order of by
+    keep = [axes.index(axis) for axis in by]
+    values = values.sum(axis=tuple(i for i in range(len(axes)) if i not in keep))
+    order = sorted(keep)
+    values = np.transpose(values, [order.index(i) for i in keep])
+    labels = [labels[i] for i in keep]
+    if len(by) == 0:
+        return values.item()
+    if len(by) == 1:
+        return pd.Series(values, index=labels[0], name=measure)
+    if len(by) == 2:
+        return pd.DataFrame(values, index=labels[0], columns=labels[1])
+    return pd.Series(
+        values.ravel(), index=pd.MultiIndex.from_product(labels), name=measure
+    )
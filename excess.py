@@ -0,0 +1,166 @@
+"""expected and excess deaths for every (month, age_group, gender, cause) cell
+
+The expected deaths of a cell come from the same cell in the 2018-2019
+baseline, either as the average of the same calendar month ("seasonal") or
+from a regression of the death rate on calendar month and a linear trend,
+projected with the population of the month ("regression"). Both work on the
+arrays of cube.py, so every cell is computed in one pass:
+
+    result = excess.excess()
+    result["p_score"][:, :, :, covid]       # arrays over cube.AXES
+    excess.summarize(result, by=("month",))  # rolled up, with intervals
+    excess.to_frame(result)                  # tidy, one row per cell
+
+The result is a cube itself, so cube.query() works on any of its measures.
+"""
+
+import numpy as np
+import pandas as pd
+from scipy import stats
+
+import cube
+
+BASELINE_YEARS = [2018, 2019]
+MEASURES = ["observed", "expected", "variance", "lower", "upper", "excess", "p_score"]
+
+
+def z_value(level):
+    """the normal quantile of a two sided interval covering level"""
+    if not 0 < level < 1:
+        raise ValueError("level is between 0 and 1")
+    return stats.norm.ppf(0.5 + level / 2)
+
+
+def baseline_months(months):
+    """mask of the baseline months"""
+    return np.isin(months.year, BASELINE_YEARS)
+
+
+def seasonal_expected(deaths, months):
+    """mean of the same calendar month over the baseline years
+
+    the variance adds the Poisson variance of the count to the variance of the
+    baseline mean
+    """
+    baseline = baseline_months(months)
+    expected = np.zeros(deaths.shape)
+    variance = np.zeros(deaths.shape)
+    for calendar in range(1, 13):
+        past = deaths[baseline & (months.month == calendar)]
+        if len(past) == 0:
+            continue
+        mean = past.mean(axis=0)
+        spread = past.var(axis=0, ddof=1) / len(past) if len(past) > 1 else 0
+        current = months.month == calendar
+        expected[current] = mean
+        variance[current] = mean + spread
+    return expected, variance
+
+
+def design(months):
+    """calendar month indicators and a yearly trend, one row per month"""
+    columns = [(months.month == calendar).astype(float) for calendar in range(1, 13)]
+    start = months[baseline_months(months)].min()
+    columns.append(np.asarray((months - start).days / 365.25))
+    return np.column_stack(columns)
+
+
+def regression_expected(deaths, population, months):
+    """rate regressed on calendar month and trend over the baseline, times population
+
+    one least squares solve covers every cell, the variance is the prediction
+    variance of the rate scaled by the squared population
+    """
+    baseline = baseline_months(months)
+    shape = deaths.shape
+    # population has no cause axis, broadcast it over causes
+    population = np.broadcast_to(population[..., None], shape)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        rates = np.where(population > 0, deaths / population, 0.0)
+    x = design(months)
+    x_base = x[baseline]
+    y_base = rates[baseline].reshape(int(baseline.sum()), -1)
+    coefs, _, _, _ = np.linalg.lstsq(x_base, y_base, rcond=None)
+    residuals = y_base - x_base @ coefs
+    dof = max(len(x_base) - x.shape[1], 1)
+    sigma2 = (residuals**2).sum(axis=0) / dof
+    # leverage of each month's row under the baseline fit
+    leverage = np.einsum("ij,jk,ik->i", x, np.linalg.pinv(x_base.T @ x_base), x)
+    expected_rate = (x @ coefs).reshape(shape)
+    rate_variance = (sigma2[None, :] * (1 + leverage[:, None])).reshape(shape)
+    return expected_rate * population, rate_variance * population**2
+
+
+def excess(data=None, method="seasonal", level=0.95):
+    """expected deaths, excess deaths, P-scores and prediction intervals per cell
+
+    data is a cube from cube.get_cube(), method "seasonal" or "regression".
+    returns a cube with the MEASURES as arrays over cube.AXES, p_score is the
+    excess as a percentage of expected deaths (nan where none were expected)
+    """
+    if data is None:
+        data = cube.get_cube()
+    months = pd.DatetimeIndex(data["axes"]["month"])
+    deaths = data["deaths"]
+    if method == "seasonal":
+        expected, variance = seasonal_expected(deaths, months)
+    elif method == "regression":
+        expected, variance = regression_expected(deaths, data["population"], months)
+    else:
+        raise ValueError("unknown method " + method)
+    # a regression can project a negative rate, no deaths is the floor
+    expected = np.clip(expected, 0, None)
+    margin = z_value(level) * np.sqrt(variance)
+    result = {
+        "axes": data["axes"],
+        "observed": deaths,
+        "expected": expected,
+        "variance": variance,
+        "lower": np.clip(expected - margin, 0, None),
+        "upper": expected + margin,
+        "excess": deaths - expected,
+    }
+    with np.errstate(divide="ignore", invalid="ignore"):
+        result["p_score"] = np.where(
+            expected > 0, 100 * result["excess"] / expected, np.nan
+        )
+    return result
+
+
+def summarize(result, by=("month",), level=0.95, **filters):
+    """observed, expected and excess deaths summed over cells, with intervals
+
+    by (at least one axis) and filters work as in cube.query(). cells are
+    taken as independent, so the variance of a sum is the sum of the variances
+    """
+    summary = {}
+    for measure in ["observed", "expected", "variance"]:
+        values = cube.query(result, measure, by, **filters)
+        # two axes come back as a pivot, keep one row per combination
+        summary[measure] = values.stack() if len(by) == 2 else values
+    summary = pd.DataFrame(summary)
+    margin = z_value(level) * np.sqrt(summary["variance"])
+    summary["lower"] = (summary["expected"] - margin).clip(lower=0)
+    summary["upper"] = summary["expected"] + margin
+    summary["excess"] = summary["observed"] - summary["expected"]
+    summary["p_score"] = (100 * summary["excess"] / summary["expected"]).where(
+        summary["expected"] > 0
+    )
+    return summary
+
+
+def to_frame(result, dropzero=True):
+    """the result as a tidy DataFrame, one row per cell
+
+    cells with no deaths either observed or expected are left out unless
+    dropzero is False
+    """
+    index = pd.MultiIndex.from_product(
+        [result["axes"][axis] for axis in cube.AXES], names=cube.AXES
+    )
+    frame = pd.DataFrame(
+        {measure: np.ravel(result[measure]) for measure in MEASURES}, index=index
+    )
+    if dropzero:
+        frame = frame[(frame["observed"] > 0) | (frame["expected"] > 0)]
+    return frame.reset_index()
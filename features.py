@@ -0,0 +1,237 @@
+"""rolling, year over year and seasonal features of every monthly series
+
+Every (age_group, gender, cause) cell of the cube is a monthly series of
+deaths. The features of all of them are computed together as arrays over
+cube.AXES, so the result is a cube and cube.query() sums the ADDITIVE ones:
+
+    store = features.get_features()
+    cube.query(store, "trend", by=("month",), cause=[...])
+    features.to_frame(store, ["rolling_mean_12", "yoy_delta"], gender="Female")
+
+The decomposition is the classical one STL refines: a centered 2x12 moving
+average as trend (the window shrinks at the ends), the mean detrended value
+of each calendar month as seasonal component and what is left as residual.
+
+update_features() keeps the store on disk and, when the cube gains a month or a
+provisional month is revised, only recomputes the windows that reach the
+changed months; the seasonal profile and residuals are one broadcast over
+the stored arrays.
+"""
+
+import os
+
+import numpy as np
+import pandas as pd
+
+import cube
+import snapshot
+import wrangle
+
+FEATURE_FILE = os.path.join(snapshot.SNAPSHOT_DIR, "features", "features.npz")
+WINDOWS = [3, 6, 12]
+SEASON = 12
+HALF = SEASON // 2  # months on each side of the centered trend
+FEATURES = (
+    ["rolling_sum_{}".format(w) for w in WINDOWS]
+    + ["rolling_mean_{}".format(w) for w in WINDOWS]
+    + ["yoy_delta", "yoy_pct", "trend", "seasonal", "residual", "residual_z"]
+)
+# features of a sum of series are the sums of their features
+ADDITIVE = [name for name in FEATURES if name not in ["yoy_pct", "residual_z"]]
+
+
+def trend_weights(months, start):
+    """weights of the centered 2x12 moving average for months start onward
+
+    returns the weights over months lo onward and lo, rows are renormalized
+    where the window runs past either end of the series
+    """
+    lo = max(start - HALF, 0)
+    offsets = np.arange(lo, months)[None, :] - np.arange(start, months)[:, None]
+    weights = np.where(np.abs(offsets) < HALF, 1.0, 0.0)
+    weights[np.abs(offsets) == HALF] = 0.5
+    return weights / weights.sum(axis=1, keepdims=True), lo
+
+
+def update_windows(store, start):
+    """recompute the rolling, year over year and trend features from month start
+
+    only the months the windows of those features reach are read
+    """
+    deaths = store["deaths"]
+    months = len(deaths)
+    lo = max(start - (SEASON - 1), 0)
+    sums = np.concatenate(
+        [np.zeros((1,) + deaths.shape[1:]), np.cumsum(deaths[lo:], axis=0)]
+    )
+    for w in WINDOWS:
+        ends = np.arange(start, months) - lo + 1
+        values = sums[ends] - sums[np.clip(ends - w, 0, None)]
+        # a window reaching before the first month isn't complete
+        values[np.arange(start, months) < w - 1] = np.nan
+        store["rolling_sum_{}".format(w)][start:] = values
+        store["rolling_mean_{}".format(w)][start:] = values / w
+    previous = np.full(deaths[start:].shape, np.nan)
+    if months > SEASON:
+        first = max(start, SEASON)
+        previous[first - start :] = deaths[first - SEASON : months - SEASON]
+    store["yoy_delta"][start:] = deaths[start:] - previous
+    with np.errstate(divide="ignore", invalid="ignore"):
+        store["yoy_pct"][start:] = np.where(
+            previous > 0, 100 * (deaths[start:] - previous) / previous, np.nan
+        )
+    # the shrinking windows at the end change when months come after them
+    trend_start = max(start - HALF, 0)
+    weights, lo = trend_weights(months, trend_start)
+    store["trend"][trend_start:] = np.tensordot(weights, deaths[lo:], axes=1)
+
+
+def update_seasonal(store):
+    """the seasonal profile, residuals and their z-scores of every series"""
+    months = pd.DatetimeIndex(store["axes"]["month"])
+    detrended = store["deaths"] - store["trend"]
+    members = np.zeros((len(months), SEASON))
+    members[np.arange(len(months)), months.month - 1] = 1
+    counts = members.sum(axis=0)
+    # calendar months not seen yet have no seasonal component
+    profile = np.tensordot(members, detrended, axes=([0], [0]))
+    profile = profile / np.where(counts > 0, counts, 1).reshape(
+        (-1,) + (1,) * (detrended.ndim - 1)
+    )
+    seen = counts > 0
+    profile[seen] -= profile[seen].mean(axis=0)
+    store["seasonal"] = profile[months.month - 1]
+    store["residual"] = detrended - store["seasonal"]
+    spread = (
+        store["residual"].std(axis=0, ddof=1)
+        if len(months) > 1
+        else np.zeros(detrended.shape[1:])
+    )
+    with np.errstate(divide="ignore", invalid="ignore"):
+        store["residual_z"] = np.where(spread > 0, store["residual"] / spread, np.nan)
+
+
+def freeze(store):
+    """make the arrays read only, the store is shared between callers of get_features()"""
+    for name in ["deaths"] + FEATURES:
+        store[name].flags.writeable = False
+    return store
+
+
+def build_features(data=None):
+    """the FEATURES of every series of a cube, from scratch"""
+    if data is None:
+        data = cube.get_cube()
+    deaths = np.array(data["deaths"], dtype="float64")
+    store = {"axes": data["axes"], "deaths": deaths}
+    for name in FEATURES:
+        store[name] = np.full(deaths.shape, np.nan)
+    update_windows(store, 0)
+    update_seasonal(store)
+    return freeze(store)
+
+
+def first_change(store, data):
+    """the first month of data the store doesn't hold as is, None if up to date
+
+    0 when the series themselves differ (a new cause or age group)
+    """
+    for axis in ["age_group", "gender", "cause"]:
+        if not store["axes"][axis].equals(data["axes"][axis]):
+            return 0
+    held, months = store["axes"]["month"], data["axes"]["month"]
+    if len(held) > len(months) or not held.equals(months[: len(held)]):
+        return 0
+    changed = np.flatnonzero(
+        (store["deaths"] != data["deaths"][: len(held)])
+        .reshape(len(held), -1)
+        .any(axis=1)
+    )
+    if len(changed):
+        return int(changed[0])
+    if len(held) < len(months):
+        return len(held)
+    return None
+
+
+def refresh(store, data):
+    """bring a store up to date with a cube, recomputing only what changed"""
+    start = first_change(store, data)
+    if start is None:
+        return store
+    if start == 0:
+        return build_features(data)
+    held = len(store["axes"]["month"])
+    months = len(data["axes"]["month"])
+    updated = {
+        "axes": data["axes"],
+        "deaths": np.array(data["deaths"], dtype="float64"),
+    }
+    for name in FEATURES:
+        values = np.full(updated["deaths"].shape, np.nan)
+        values[: min(held, months)] = store[name][: min(held, months)]
+        updated[name] = values
+    update_windows(updated, start)
+    update_seasonal(updated)
+    return freeze(updated)
+
+
+def save_features(store, path=FEATURE_FILE):
+    """write the store as an uncompressed .npz, without pickled objects"""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    arrays = {name: store[name] for name in ["deaths"] + FEATURES}
+    arrays["month"] = store["axes"]["month"].to_numpy(dtype="datetime64[ns]")
+    for axis in ["age_group", "gender", "cause"]:
+        arrays[axis] = np.asarray(store["axes"][axis], dtype=str)
+    # write to a temporary file first so readers never see half a store
+    with open(path + ".tmp", "wb") as file:
+        np.savez(file, **arrays)
+    os.replace(path + ".tmp", path)
+
+
+def load_features(path=FEATURE_FILE):
+    """the stored features, None if there are none"""
+    if not os.path.exists(path):
+        return None
+    with np.load(path) as arrays:
+        missing = [name for name in ["deaths"] + FEATURES if name not in arrays]
+        if missing:
+            return None
+        store = {name: arrays[name] for name in ["deaths"] + FEATURES}
+        store["axes"] = {axis: pd.Index(arrays[axis], name=axis) for axis in cube.AXES}
+    store["axes"]["month"] = pd.DatetimeIndex(store["axes"]["month"], name="month")
+    return freeze(store)
+
+
+def update_features(data, path=FEATURE_FILE):
+    """the features of a cube, updated from the stored ones and saved"""
+    stored = load_features(path)
+    store = build_features(data) if stored is None else refresh(stored, data)
+    if store is not stored:
+        save_features(store, path)
+    return store
+
+
+@wrangle.cached(lambda: wrangle.list_files(".") + [wrangle.POPULATION_FILE])
+def get_features():
+    """the features of cube.get_cube(), once per version of the source files"""
+    return update_features(cube.get_cube())
+
+
+def to_frame(store, names=None, dropzero=True, **filters):
+    """features as a tidy DataFrame, one row per (month, age_group, gender, cause)
+
+    filters pick labels of an axis as in cube.query(), series without any
+    deaths are left out unless dropzero is False
+    """
+    names = list(names or FEATURES)
+    columns = {}
+    for name in ["deaths"] + names:
+        values, labels = cube._select(store, name, cube.AXES, filters, {})
+        columns[name] = np.ravel(values)
+    frame = pd.DataFrame(
+        columns, index=pd.MultiIndex.from_product(labels, names=cube.AXES)
+    )
+    if dropzero:
+        frame = frame[frame.groupby(level=cube.AXES[1:])["deaths"].transform("sum") > 0]
+    return frame.reset_index()
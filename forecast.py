@@ -0,0 +1,223 @@
+"""Prophet forecasts of many df2 series at once
+
+forecasting.ipynb fits one target at a time, each fit rebuilding df2 through
+wrangle.get_df_only(). Here df2 is built once and every (series, seasonality
+mode) pair is fitted in its own worker process, with a timeout per fit so a
+slow series (multiplicative covid_deaths) can't hold up the rest:
+
+    forecasts, scores = forecast.run(seasonality_modes=["additive", "multiplicative"])
+    future, _ = forecast.run(["all_cause_deaths"], holdout=False, periods=24)
+
+forecasts is a tidy table with one row per series, mode and month, scores has
+the validate and test RMSE, fit time and status of each fit. prophet is only
+needed when fitting.
+"""
+
+import logging
+import multiprocessing
+import os
+import signal
+import time
+from concurrent.futures import ProcessPoolExecutor
+from math import sqrt
+
+import numpy as np
+import pandas as pd
+
+import model_store
+import wrangle
+
+try:
+    from prophet import Prophet
+except ImportError:  # only needed to fit
+    Prophet = None
+
+TIMEOUT = 300  # seconds per fit
+
+
+def target_columns(df2, genders=True, scaled=True):
+    """the series of df2 to forecast, every cause and gender series by default"""
+    columns = []
+    for col in df2.columns:
+        if col in ["difference"] or col.startswith("average_"):
+            continue
+        if not genders and col.startswith(("male_", "female_")):
+            continue
+        if not scaled and "scaled" in col:
+            continue
+        columns.append(col)
+    return columns
+
+
+def split(df):
+    """train, validate and test like the notebook, 70/20/10 sharing edge months"""
+    n = len(df)
+    train = df[: int(n * 0.7)]
+    validate = df[int(n * 0.7) - 1 : int(n * 0.9)]
+    test = df[int(n * 0.9) - 1 :]
+    return train, validate, test
+
+
+def rmse(actual, predicted):
+    """root mean squared error over the months both series have"""
+    actual, predicted = actual.align(predicted, join="inner")
+    if len(actual) == 0:
+        return np.nan
+    return sqrt(((actual - predicted) ** 2).mean())
+
+
+def fit_predict(name, train, seasonality_mode, horizon, store):
+    """fit a model on train and predict horizon months past it
+
+    returns the predictions and how the model was obtained
+    """
+    logging.getLogger("cmdstanpy").setLevel(logging.WARNING)
+    logging.getLogger("prophet").setLevel(logging.WARNING)
+    if store:
+        model, fit = model_store.fit(name, train, seasonality_mode)
+    else:
+        model = Prophet(seasonality_mode=seasonality_mode).fit(train)
+        fit = "cold"
+    future = model.make_future_dataframe(periods=horizon, freq="MS")
+    yhat = model.predict(future)[["ds", "yhat", "yhat_lower", "yhat_upper"]]
+    return yhat, fit
+
+
+def fit_child(connection, *args):
+    """fit_predict() in a child process, sending back its status and result
+
+    the child leads its own process group so the Stan processes it starts can
+    be killed along with it
+    """
+    if hasattr(os, "setsid"):
+        os.setsid()
+    try:
+        connection.send(("ok", fit_predict(*args)))
+    except Exception as error:  # a failing series shouldn't fail the batch
+        connection.send((repr(error), None))
+    finally:
+        connection.close()
+
+
+def fit_with_timeout(timeout, *args):
+    """fit_predict() in a child process, killed when it runs over timeout
+
+    returns a status ("ok", "timeout" or the error) and fit_predict()'s result
+    """
+    receiver, sender = multiprocessing.Pipe(duplex=False)
+    child = multiprocessing.Process(target=fit_child, args=(sender,) + args)
+    child.start()
+    sender.close()
+    try:
+        if receiver.poll(timeout):
+            status, result = receiver.recv()
+        else:
+            status, result = "timeout", None
+    except EOFError:  # the child died without an answer
+        status, result = "exited", None
+    finally:
+        receiver.close()
+    if child.is_alive():
+        try:
+            os.killpg(child.pid, signal.SIGKILL)
+        except (AttributeError, ProcessLookupError):  # no process groups (yet)
+            child.kill()
+    child.join()
+    if status == "exited":
+        status = "exit code {}".format(child.exitcode)
+    return status, result
+
+
+def fit_series(name, series, seasonality_mode, holdout, periods, timeout, store):
+    """fit one series in a worker, returns its forecast rows and score
+
+    with a timeout the fit runs in a child process that is killed, with the
+    Stan processes it started, when it runs over, and is reported with status
+    "timeout". SIGALRM isn't used for this, it only fires in the main thread
+    and can't interrupt Stan while it samples. with store the fit goes
+    through model_store, the score's "fit" says whether it was reused
+    """
+    start = time.perf_counter()
+    score = {"series": name, "seasonality_mode": seasonality_mode}
+    df = pd.DataFrame({"ds": series.index, "y": series.to_numpy()})
+    df.index = series.index
+    train, validate, test = split(df) if holdout else (df, df[:0], df[:0])
+    args = (
+        name,
+        train,
+        seasonality_mode,
+        len(df) - len(train) if holdout else periods,
+        store,
+    )
+    if timeout:
+        score["status"], result = fit_with_timeout(timeout, *args)
+    else:
+        try:
+            result, score["status"] = fit_predict(*args), "ok"
+        except Exception as error:  # a failing series shouldn't fail the batch
+            result, score["status"] = None, repr(error)
+    yhat = None
+    if result is not None:
+        yhat, score["fit"] = result
+    score["seconds"] = time.perf_counter() - start
+    if yhat is None:
+        score["validate_rmse"] = score["test_rmse"] = np.nan
+        return None, score
+    yhat = yhat.set_index("ds")
+    score["validate_rmse"] = rmse(validate["y"], yhat["yhat"])
+    score["test_rmse"] = rmse(test["y"], yhat["yhat"])
+    rows = yhat.join(df["y"]).reset_index()
+    rows["split"] = "future"
+    for part, months in [("test", test), ("validate", validate), ("train", train)]:
+        rows.loc[rows["ds"].isin(months.index), "split"] = part
+    rows.insert(0, "seasonality_mode", seasonality_mode)
+    rows.insert(0, "series", name)
+    return rows, score
+
+
+def run(
+    targets=None,
+    seasonality_modes=("additive",),
+    holdout=True,
+    periods=24,
+    timeout=TIMEOUT,
+    workers=None,
+    df2=None,
+    store=False,
+):
+    """fit every target of df2 under every seasonality mode across a process pool
+
+    with holdout the models are fitted on the training months and scored on
+    validate and test, otherwise they are fitted on all months and forecast
+    periods months ahead. with store, fits are reused or warm started from
+    model_store. returns the tidy forecasts and the scores per fit
+    """
+    if Prophet is None:
+        raise ImportError("forecasting needs prophet, pip install prophet")
+    if df2 is None:
+        df2 = wrangle.get_df_only()
+    if targets is None:
+        targets = target_columns(df2)
+    if isinstance(seasonality_modes, str):
+        seasonality_modes = [seasonality_modes]
+    fits = [(target, mode) for target in targets for mode in seasonality_modes]
+    workers = workers or min(len(fits), os.cpu_count() or 1)
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [
+            executor.submit(
+                fit_series,
+                target,
+                df2[target],
+                mode,
+                holdout,
+                periods,
+                timeout,
+                store,
+            )
+            for target, mode in fits
+        ]
+        results = [future.result() for future in futures]
+    frames = [rows for rows, _ in results if rows is not None]
+    forecasts = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+    scores = pd.DataFrame([score for _, score in results])
+    return forecasts, scores
@@ -0,0 +1,138 @@
+"""incremental refresh of the merged table as new monthly exports arrive
+
+A refresh keeps the already cleaned rows of each export and only prepares
+the exports that are new or changed since the last refresh. A changed
+export replaces its own rows, and wins the months it covers from other
+exports (revised provisional months); the monthly cause counts that df2 is
+built from are updated for those months only.
+
+    state = incremental.refresh()
+    # ... a new or revised "Provisional Mortality Statistics" file lands ...
+    state = incremental.refresh(state)
+    df2 = incremental.make_df2(state)[0]
+    df = incremental.merged_table(state)
+
+Each cleaned export is also snapshotted, so a new process only re-parses
+the files that changed since any earlier run.
+"""
+
+import pandas as pd
+
+import snapshot
+import wrangle
+
+
+def export_fingerprints():
+    """fingerprint of each yearly export, including the population it is merged with"""
+    population = wrangle.file_fingerprint([wrangle.POPULATION_FILE])
+    return {
+        file: wrangle.file_fingerprint([file]) + population
+        for file in sorted(wrangle.list_files("."))
+    }
+
+
+def prepare_export(file, fingerprint, population):
+    """clean one export and merge it with the population, reusing its snapshot"""
+    name = "exports/" + file
+    df = snapshot.load_snapshot(name, fingerprint)
+    if df is None:
+        df = wrangle.prep_data(wrangle.read_export(file))
+        df = wrangle.add_crude_rate(wrangle.merge_data(df, population))
+        snapshot.save_snapshot(name, df, fingerprint)
+    return df
+
+
+def refresh(state=None):
+    """bring state up to date with the exports on disk
+
+    state is the dict returned by the previous refresh, None starts from
+    scratch. it holds the merged rows and monthly cause counts of each export
+    under "parts" and "counts", which export each month is taken from under
+    "owners", and the combined counts make_df2() needs under "cause_counts".
+    only the changed exports are prepared and only the counts of the months
+    they touch are replaced, so the cost follows the size of the new data
+    """
+    fingerprints = export_fingerprints()
+    if state is None:
+        state = {
+            "fingerprints": {},
+            "parts": {},
+            "counts": {},
+            "owners": {},
+            "cause_counts": None,
+        }
+    changed = [
+        file
+        for file, fingerprint in fingerprints.items()
+        if state["fingerprints"].get(file) != fingerprint
+    ]
+    removed = [file for file in state["fingerprints"] if file not in fingerprints]
+    if not changed and not removed:
+        return state
+    population = wrangle.prep_pop_data(wrangle.get_population())
+    # months whose rows change: those of the changed or removed exports,
+    # before and after the change
+    stale = set()
+    for file in removed:
+        stale.update(month for month, owner in state["owners"].items() if owner == file)
+        for key in ["fingerprints", "parts", "counts"]:
+            state[key].pop(file, None)
+    for file in changed:
+        table = prepare_export(file, fingerprints[file], population)
+        stale.update(month for month, owner in state["owners"].items() if owner == file)
+        state["parts"][file] = table
+        state["counts"][file] = wrangle.monthly_cause_counts(table)
+        state["fingerprints"][file] = fingerprints[file]
+        # a changed export wins the months it covers (a revised provisional month)
+        for month in months_of(state, file):
+            state["owners"][month] = file
+            stale.add(month)
+    # months a changed or removed export no longer covers fall back to any other
+    for month in stale:
+        owner = state["owners"].get(month)
+        if owner in state["counts"] and month in months_of(state, owner):
+            continue
+        state["owners"].pop(month, None)
+        for file in state["counts"]:
+            if month in months_of(state, file):
+                state["owners"][month] = file
+    # only the counts of the stale months are replaced, from their owners
+    new_counts = []
+    for file in set(
+        state["owners"][month] for month in stale if month in state["owners"]
+    ):
+        counts = state["counts"][file]
+        months = counts.index.get_level_values("month")
+        owned = [m for m in stale if state["owners"].get(m) == file]
+        new_counts.append(counts[months.isin(owned)])
+    kept = []
+    if state["cause_counts"] is not None:
+        counts = state["cause_counts"]
+        kept = [counts[~counts.index.get_level_values("month").isin(list(stale))]]
+    # causes that only appear in some exports have no column in the others
+    state["cause_counts"] = (
+        pd.concat(kept + new_counts).fillna(0).astype("int64").sort_index()
+    )
+    return state
+
+
+def months_of(state, file):
+    """the months of an export's monthly cause counts"""
+    return set(state["counts"][file].index.get_level_values("month"))
+
+
+def merged_table(state):
+    """the merged table of every export, each month from the export owning it
+
+    built on demand, refresh() itself never touches the rows of unchanged exports
+    """
+    tables = []
+    for file, table in state["parts"].items():
+        owned = [month for month, owner in state["owners"].items() if owner == file]
+        tables.append(table[table["month"].isin(owned)])
+    return snapshot.concat_typed(tables)
+
+
+def make_df2(state):
+    """make_df2() from the incrementally maintained tables"""
+    return wrangle.make_df2(cause_counts=state["cause_counts"])
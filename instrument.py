@@ -0,0 +1,208 @@
+"""opt-in timing of the wrangle.py stages
+
+enable() swaps the stage functions of wrangle.py (and the nodes of
+pipeline.py) for wrappers that record wall time, rows in and out, the change
+in traced memory and, for cached loaders, whether the result came from
+memory, a snapshot or was built. disable() puts the original functions back,
+so nothing is wrapped and nothing is paid while it is off:
+
+    with instrument.profile(memory=True):
+        wrangle.make_df2()
+    instrument.summary()                       # one row per stage
+    instrument.chrome_trace("trace.json")      # open in chrome://tracing or Perfetto
+
+With log=True every stage is also logged as a line of JSON to the
+"wrangle.stages" logger as it finishes.
+"""
+
+import functools
+import json
+import logging
+import os
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+import pandas as pd
+
+import pipeline
+import wrangle
+
+# the wrangle.py functions recorded as stages
+STAGES = [
+    "get_exports",
+    "make_df",
+    "read_export",
+    "drop_footer",
+    "prep_data",
+    "drop_lagged",
+    "parse_months",
+    "get_population",
+    "prep_pop_data",
+    "monthly_population",
+    "merge_data",
+    "add_crude_rate",
+    "wrangle_data",
+    "prep_covid",
+    "clean_covid",
+    "prep_age_deaths",
+    "clean_age_deaths",
+    "get_monthly_deaths",
+    "monthly_cause_counts",
+    "monthly_cause_deaths",
+    "make_df2",
+]
+
+logger = logging.getLogger("wrangle.stages")
+_originals = {}
+_events = []
+_state = threading.local()
+_settings = {"memory": False, "log": False, "started": 0.0}
+
+
+def rows(value):
+    """rows of a frame, or of the first frame in a tuple like make_df2's"""
+    if isinstance(value, tuple) and value:
+        value = value[0]
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        return len(value)
+    return None
+
+
+def wrap(name, func):
+    """a wrapper recording a call of func as a stage event"""
+
+    @functools.wraps(func)
+    def stage(*args, **kwargs):
+        depth = getattr(_state, "depth", 0)
+        _state.depth = depth + 1
+        rows_in = sum(rows(arg) or 0 for arg in list(args) + list(kwargs.values()))
+        memory = _settings["memory"] and tracemalloc.is_tracing()
+        before = tracemalloc.get_traced_memory()[0] if memory else None
+        start = time.perf_counter()
+        try:
+            result = func(*args, **kwargs)
+        finally:
+            _state.depth = depth
+        seconds = time.perf_counter() - start
+        event = {
+            "stage": name,
+            "start": start - _settings["started"],
+            "seconds": seconds,
+            "rows_in": rows_in,
+            "rows_out": rows(result),
+            "memory_mb": (
+                (tracemalloc.get_traced_memory()[0] - before) / 2**20
+                if memory
+                else None
+            ),
+            "cache": getattr(func, "last_lookup", None),
+            "depth": depth,
+            "thread": threading.get_ident(),
+        }
+        _events.append(event)
+        if _settings["log"]:
+            logger.info(json.dumps(event))
+        return result
+
+    return stage
+
+
+def enable(memory=False, log=False):
+    """start recording every stage, memory=True also traces allocations (slower)"""
+    if _originals:
+        return
+    _settings.update(memory=memory, log=log, started=time.perf_counter())
+    if memory and not tracemalloc.is_tracing():
+        tracemalloc.start()
+        _settings["started_tracing"] = True
+    for name in STAGES:
+        func = getattr(wrangle, name)
+        _originals[name] = func
+        setattr(wrangle, name, wrap(name, func))
+    # pipeline holds the functions themselves, not their names
+    for node, (func, upstream) in pipeline.NODES.items():
+        if func.__name__ in _originals and _originals[func.__name__] is func:
+            pipeline.NODES[node] = (getattr(wrangle, func.__name__), upstream)
+
+
+def disable():
+    """put the original functions back, the recorded events are kept"""
+    for node, (func, upstream) in pipeline.NODES.items():
+        if func.__name__ in _originals:
+            pipeline.NODES[node] = (_originals[func.__name__], upstream)
+    for name, func in _originals.items():
+        setattr(wrangle, name, func)
+    _originals.clear()
+    if _settings.pop("started_tracing", False):
+        tracemalloc.stop()
+
+
+@contextmanager
+def profile(memory=False, log=False):
+    """record the stages run inside the with block"""
+    enable(memory, log)
+    try:
+        yield _events
+    finally:
+        disable()
+
+
+def events():
+    """the recorded stage events, oldest first"""
+    return list(_events)
+
+
+def reset():
+    """forget the recorded events"""
+    _events.clear()
+
+
+def summary():
+    """calls, total and mean seconds, rows and cache lookups per stage"""
+    df = pd.DataFrame(_events)
+    if df.empty:
+        return df
+    df["cache"] = df["cache"].fillna("-")
+    table = df.groupby("stage").agg(
+        calls=("seconds", "size"),
+        seconds=("seconds", "sum"),
+        mean_seconds=("seconds", "mean"),
+        rows_in=("rows_in", "sum"),
+        rows_out=("rows_out", "sum"),
+        memory_mb=("memory_mb", "sum"),
+    )
+    lookups = df.groupby(["stage", "cache"]).size().unstack(fill_value=0)
+    table = table.join(lookups.drop(columns="-", errors="ignore"))
+    return table.sort_values("seconds", ascending=False)
+
+
+def write_log(path):
+    """the recorded events as JSON lines"""
+    with open(path, "w") as file:
+        for event in _events:
+            file.write(json.dumps(event) + "\n")
+
+
+def chrome_trace(path):
+    """the recorded events in the Chrome trace event format"""
+    trace = [
+        {
+            "name": event["stage"],
+            "cat": "wrangle",
+            "ph": "X",
+            "ts": event["start"] * 1e6,
+            "dur": event["seconds"] * 1e6,
+            "pid": os.getpid(),
+            "tid": event["thread"],
+            "args": {
+                key: event[key]
+                for key in ["rows_in", "rows_out", "memory_mb", "cache"]
+                if event[key] is not None
+            },
+        }
+        for event in _events
+    ]
+    with open(path, "w") as file:
+        json.dump({"traceEvents": trace, "displayTimeUnit": "ms"}, file)
@@ -0,0 +1,102 @@
+"""load test for service.py, requests per second and latency percentiles
+
+Opens a number of keep-alive connections to a running service and sends GET
+requests over them for a fixed time, cycling through PATHS:
+
+    python service.py &
+    python loadtest.py --connections 32 --seconds 10
+"""
+
+import argparse
+import asyncio
+import time
+
+import numpy as np
+
+import service
+
+PATHS = [
+    "/deaths?by=month",
+    "/deaths?by=month,age_group&cause_code=GR113-137",
+    "/rates?by=month,gender&age_group=85%2B",
+    "/top_causes?n=10",
+    "/top_causes?n=5&gender=Female&month=2021-01-01",
+    "/average_age?table=covid&by=month,gender",
+    "/covid_vs_all",
+    "/excess?by=month",
+]
+
+
+async def read_response(reader):
+    """status and body length of one response"""
+    status = int((await reader.readline()).split()[1])
+    length = 0
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b""):
+            break
+        name, _, value = line.decode("latin-1").partition(":")
+        if name.lower() == "content-length":
+            length = int(value)
+    await reader.readexactly(length)
+    return status
+
+
+async def client(host, port, paths, deadline, latencies, errors):
+    """send requests over one connection until the deadline"""
+    reader, writer = await asyncio.open_connection(host, port)
+    i = 0
+    try:
+        while time.perf_counter() < deadline:
+            path = paths[i % len(paths)]
+            i += 1
+            start = time.perf_counter()
+            writer.write(
+                "GET {} HTTP/1.1\r\nHost: {}\r\n\r\n".format(path, host).encode()
+            )
+            await writer.drain()
+            status = await read_response(reader)
+            latencies.append(time.perf_counter() - start)
+            if status != 200:
+                errors.append((path, status))
+    finally:
+        writer.close()
+
+
+async def load(host, port, connections, seconds, paths=PATHS):
+    """run the clients, returns the latencies of every request and the errors"""
+    latencies, errors = [], []
+    deadline = time.perf_counter() + seconds
+    # start each client at a different path so every endpoint is hit at once
+    await asyncio.gather(
+        *[
+            client(host, port, paths[i:] + paths[:i], deadline, latencies, errors)
+            for i in range(connections)
+        ]
+    )
+    return latencies, errors
+
+
+def report(latencies, errors, seconds):
+    latencies = np.array(latencies) * 1000
+    print("requests     {}".format(len(latencies)))
+    print("errors       {}".format(len(errors)))
+    print("requests/s   {:.0f}".format(len(latencies) / seconds))
+    for q in [50, 95, 99]:
+        print("p{:<11} {:.2f} ms".format(q, np.percentile(latencies, q)))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default=service.HOST)
+    parser.add_argument("--port", type=int, default=service.PORT)
+    parser.add_argument("--connections", type=int, default=16)
+    parser.add_argument("--seconds", type=float, default=5)
+    args = parser.parse_args()
+    start = time.perf_counter()
+    latencies, errors = asyncio.run(
+        load(args.host, args.port, args.connections, args.seconds)
+    )
+    report(latencies, errors, time.perf_counter() - start)
+    for path, status in errors[:10]:
+        print("  {} -> {}".format(path, status))
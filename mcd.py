@@ -0,0 +1,359 @@
+"""multiple cause of death (MCD) exports as sparse cause x cause matrices
+
+wrangle.py only reads the underlying cause (UCD) of each death. A WONDER
+query grouped by Month, Ten-Year Age Groups, Gender, "UCD - ICD-10 113
+Cause List" and "MCD - ICD-10 113 Cause List" counts, for every underlying
+cause, the deaths that mention each other cause anywhere on the
+certificate. Saved as tab separated files starting with MCD_PREFIX, e.g.
+"Multiple Cause of Death, 2021.txt", they are read a chunk at a time and
+kept as one scipy.sparse CSR matrix with a block of rows per (month,
+age_group, gender) slice: rows are underlying causes, columns mentioned
+causes. Only the non-zero pairs are stored:
+
+    store = mcd.get_mcd()
+    mcd.co_occurring(store, "U07.1", year=2021, age_group="85+")
+    mcd.cooccurrence(store, gender="Female")     # cause x cause CSR, summed
+
+Causes can be given by 113 list code (GR113-137), ICD-10 code (U07.1) or a
+piece of their label.
+"""
+
+import os
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+import cause_index
+import snapshot
+import wrangle
+
+MCD_PREFIX = "Multiple Cause"
+MCD_FILE = os.path.join(snapshot.SNAPSHOT_DIR, "mcd", "mcd.npz")
+SLICE_AXES = ["month", "age_group", "gender"]
+# chunks kept apart before their pairs are summed into one part
+FOLD_PARTS = 8
+PART_COLUMNS = SLICE_AXES + ["cause", "mentioned", "deaths"]
+
+
+def list_mcd_files(path):
+    """the MCD exports in a directory"""
+    return sorted(
+        os.path.join(path, file)
+        for file in os.listdir(path)
+        if file.startswith(MCD_PREFIX) and file.endswith(".txt")
+    )
+
+
+def clean_mcd(df):
+    """the rows of a chunk of an MCD export, with the columns renamed like prep_data()"""
+    df = df[df["Month Code"].notna() & df["MCD - ICD-10 113 Cause List Code"].notna()]
+    df = wrangle.drop_lagged(df)
+    df = df[
+        [
+            "Month Code",
+            "Ten-Year Age Groups Code",
+            "Gender",
+            "UCD - ICD-10 113 Cause List",
+            "UCD - ICD-10 113 Cause List Code",
+            "MCD - ICD-10 113 Cause List",
+            "MCD - ICD-10 113 Cause List Code",
+            "Deaths",
+        ]
+    ]
+    df.columns = [
+        "month",
+        "age_group",
+        "gender",
+        "cause",
+        "cause_code",
+        "mentioned",
+        "mentioned_code",
+        "deaths",
+    ]
+    # suppressed counts are left out, they are never mentioned in a query result
+    df = df[pd.to_numeric(df["deaths"], errors="coerce").notna()]
+    df = df.astype({"deaths": "int64"})
+    df["age_group"] = df["age_group"].replace(wrangle.AGE_CODES)
+    return df
+
+
+def encode(values, ids):
+    """integer ids of values, adding the ones not seen yet to ids"""
+    codes, uniques = pd.factorize(values)
+    lookup = [ids.setdefault(value, len(ids)) for value in uniques]
+    return np.asarray(lookup, dtype="int64")[codes]
+
+
+def new_state():
+    """the state of a streaming read, vocabularies and the triples of each chunk"""
+    return {
+        "vocab": {axis: {} for axis in SLICE_AXES + ["cause"]},
+        "labels": {},
+        "parts": [],
+    }
+
+
+def add_chunk(state, chunk):
+    """add the (slice, underlying, mentioned) deaths of a cleaned chunk
+
+    the chunk is summed to one row per pair and kept as integer ids, every
+    FOLD_PARTS chunks the parts are summed into one so memory stays close to
+    the size of the final matrix
+    """
+    chunk = chunk.groupby(
+        SLICE_AXES + ["cause_code", "mentioned_code"], observed=True, sort=False
+    )["deaths"].sum()
+    chunk = chunk.reset_index()
+    vocab = state["vocab"]
+    part = {axis: encode(chunk[axis], vocab[axis]) for axis in SLICE_AXES}
+    part["cause"] = encode(chunk["cause_code"], vocab["cause"])
+    part["mentioned"] = encode(chunk["mentioned_code"], vocab["cause"])
+    part["deaths"] = chunk["deaths"].to_numpy(dtype="int64")
+    state["parts"].append(part)
+    if len(state["parts"]) > FOLD_PARTS:
+        state["parts"] = [fold(state)]
+    return state
+
+
+def concatenated(parts):
+    """the columns of the parts one after the other, empty ones if there are none"""
+    return {
+        name: np.concatenate(
+            [np.zeros(0, dtype="int64")] + [part[name] for part in parts]
+        )
+        for name in PART_COLUMNS
+    }
+
+
+def fold(state):
+    """the parts of a state summed into one part with a row per pair"""
+    parts = concatenated(state["parts"])
+    # one key per (slice, underlying, mentioned) from the ids, mixed radix
+    key = np.zeros(len(parts["deaths"]), dtype="int64")
+    for name in PART_COLUMNS[:-1]:
+        vocab = state["vocab"]["cause" if name == "mentioned" else name]
+        key = key * len(vocab) + parts[name]
+    keys, inverse = np.unique(key, return_inverse=True)
+    part = {"deaths": np.bincount(inverse, weights=parts["deaths"]).astype("int64")}
+    for name in reversed(PART_COLUMNS[:-1]):
+        vocab = state["vocab"]["cause" if name == "mentioned" else name]
+        part[name] = keys % len(vocab)
+        keys = keys // len(vocab)
+    return part
+
+
+def add_labels(state, chunk):
+    """remember the label of every cause code of a cleaned chunk"""
+    for code_column, label_column in [
+        ("cause_code", "cause"),
+        ("mentioned_code", "mentioned"),
+    ]:
+        codes = chunk.drop_duplicates(code_column)
+        for code, label in zip(codes[code_column], codes[label_column]):
+            state["labels"].setdefault(code, label)
+
+
+def ranks(ids):
+    """labels of a vocabulary in sorted order, and the sorted position of each id"""
+    labels = pd.Index(list(ids))
+    order = labels.argsort()
+    position = np.empty(len(labels), dtype="int64")
+    position[order] = np.arange(len(labels))
+    return labels[order], position
+
+
+def finish(state):
+    """the CSR store of a streaming read, slices and causes in sorted order
+
+    a read without any rows gives a store without slices
+    """
+    parts = concatenated(state["parts"])
+    # one key per slice from the sorted positions of its labels, sorted as they are
+    key = np.zeros(len(parts["deaths"]), dtype="int64")
+    labels = {}
+    for axis in SLICE_AXES:
+        labels[axis], position = ranks(state["vocab"][axis])
+        key = key * len(labels[axis]) + position[parts[axis]]
+    slice_keys, slice_ids = np.unique(key, return_inverse=True)
+    causes, cause_position = ranks(state["vocab"]["cause"])
+    rows = slice_ids * len(causes) + cause_position[parts["cause"]]
+    cols = cause_position[parts["mentioned"]]
+    # the constructor sums the pairs repeated across chunks
+    matrix = sparse.csr_matrix(
+        (parts["deaths"], (rows, cols)),
+        shape=(len(slice_keys) * len(causes), len(causes)),
+    )
+    matrix.data = matrix.data.astype("int32")
+    slices = {}
+    for axis in reversed(SLICE_AXES):
+        slices[axis] = labels[axis][slice_keys % len(labels[axis])]
+        slice_keys = slice_keys // len(labels[axis])
+    slices = pd.DataFrame({axis: np.asarray(slices[axis]) for axis in SLICE_AXES})
+    slices["month"] = wrangle.parse_months(slices["month"])
+    return {
+        "slices": slices,
+        "causes": pd.DataFrame(
+            {"code": causes, "cause": [state["labels"][code] for code in causes]}
+        ),
+        "matrix": matrix,
+    }
+
+
+def read_mcd(files=None, chunksize=wrangle.CHUNKSIZE):
+    """stream MCD exports into a store, one chunk in memory at a time"""
+    if files is None:
+        files = list_mcd_files(".")
+    if not files:
+        raise FileNotFoundError("no {}*.txt exports found".format(MCD_PREFIX))
+    state = new_state()
+    for file in files:
+        for chunk in wrangle.read_chunks(file, clean_mcd, chunksize):
+            add_labels(state, chunk)
+            add_chunk(state, chunk)
+    return finish(state)
+
+
+def save_mcd(store, fingerprint, path=MCD_FILE):
+    """write the store and the fingerprint of the exports it was read from"""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    matrix = store["matrix"]
+    with open(path + ".tmp", "wb") as file:
+        np.savez(
+            file,
+            data=matrix.data,
+            indices=matrix.indices,
+            indptr=matrix.indptr,
+            shape=np.array(matrix.shape),
+            month=store["slices"]["month"].to_numpy(dtype="datetime64[ns]"),
+            age_group=store["slices"]["age_group"].to_numpy(dtype=str),
+            gender=store["slices"]["gender"].to_numpy(dtype=str),
+            code=store["causes"]["code"].to_numpy(dtype=str),
+            cause=store["causes"]["cause"].to_numpy(dtype=str),
+            fingerprint=np.array(repr(fingerprint)),
+        )
+    os.replace(path + ".tmp", path)
+
+
+def load_mcd(fingerprint, path=MCD_FILE):
+    """the saved store, None if it is missing or was read from other exports"""
+    if not os.path.exists(path):
+        return None
+    with np.load(path) as arrays:
+        if str(arrays["fingerprint"]) != repr(fingerprint):
+            return None
+        matrix = sparse.csr_matrix(
+            (arrays["data"], arrays["indices"], arrays["indptr"]),
+            shape=tuple(arrays["shape"]),
+        )
+        slices = pd.DataFrame({axis: arrays[axis] for axis in SLICE_AXES})
+        causes = pd.DataFrame({"code": arrays["code"], "cause": arrays["cause"]})
+    return {"slices": slices, "causes": causes, "matrix": matrix}
+
+
+@wrangle.cached(lambda: list_mcd_files("."))
+def get_mcd():
+    """the store of the MCD exports here, from its snapshot when fresh"""
+    files = list_mcd_files(".")
+    fingerprint = wrangle.file_fingerprint(files)
+    store = load_mcd(fingerprint)
+    if store is None:
+        store = read_mcd(files)
+        save_mcd(store, fingerprint)
+    return store
+
+
+def slice_positions(store, year=None, month=None, age_group=None, gender=None):
+    """positions of the slices matching every given filter"""
+    slices = store["slices"]
+    keep = np.ones(len(slices), dtype=bool)
+    if year is not None:
+        years = [year] if np.isscalar(year) else year
+        keep &= slices["month"].dt.year.isin([int(y) for y in years]).to_numpy()
+    for axis, wanted in [
+        ("month", month),
+        ("age_group", age_group),
+        ("gender", gender),
+    ]:
+        if wanted is None:
+            continue
+        if isinstance(wanted, str) or not np.iterable(wanted):
+            wanted = [wanted]
+        if axis == "month":
+            wanted = pd.to_datetime(list(wanted))
+        keep &= slices[axis].isin(wanted).to_numpy()
+    return np.flatnonzero(keep)
+
+
+def cooccurrence(store, **filters):
+    """the underlying x mentioned cause matrix summed over the matching slices
+
+    filters are year, month, age_group and gender, each a label or a list
+    """
+    n = len(store["causes"])
+    positions = slice_positions(store, **filters)
+    rows = (positions[:, None] * n + np.arange(n)).ravel()
+    # the selected blocks stacked, then folded onto one block of n rows
+    blocks = store["matrix"][rows].tocoo()
+    return sparse.csr_matrix(
+        (blocks.data.astype("int64"), (blocks.row % n, blocks.col)), shape=(n, n)
+    )
+
+
+def resolve(store, cause):
+    """position of a cause given by 113 list code, ICD-10 code or label text"""
+    causes = store["causes"]
+    codes = causes["code"].to_numpy()
+    if cause in codes:
+        return int(np.flatnonzero(codes == cause)[0])
+    key, end = cause_index.icd_key(cause), cause_index.icd_key(cause, end=True)
+    matches = []
+    for position, label in enumerate(causes["cause"]):
+        ranges = cause_index.icd_ranges(label)
+        for start, stop in ranges:
+            if start <= key and end <= stop:
+                # catch-all groups list codes too ("Other and unspecified
+                # infectious ... U07.1"), prefer an exact range, then a "#"
+                # main group, then the cause listing the fewest ranges
+                exact = start == key and stop == end
+                matches.append(
+                    (not exact, not label.startswith("#"), len(ranges), position)
+                )
+    if matches:
+        return min(matches)[-1]
+    found = np.flatnonzero(causes["cause"].str.contains(cause, case=False, regex=False))
+    if len(found) == 1:
+        return int(found[0])
+    raise KeyError("no single cause matches {!r}".format(cause))
+
+
+def co_occurring(store, cause, n=10, role="underlying", **filters):
+    """the n causes most often on the same certificates as cause
+
+    role "underlying" counts the causes mentioned on deaths from cause,
+    "mentioned" the underlying causes of deaths mentioning it and "either"
+    both. share is the fraction of the cause's deaths (underlying) or
+    mentions (mentioned) they make up
+    """
+    if role not in ["underlying", "mentioned", "either"]:
+        raise ValueError("role is underlying, mentioned or either")
+    position = resolve(store, cause)
+    matrix = cooccurrence(store, **filters)
+    counts = np.zeros(matrix.shape[0])
+    if role in ["underlying", "either"]:
+        counts += matrix.getrow(position).toarray().ravel()
+    if role in ["mentioned", "either"]:
+        counts += matrix.getcol(position).toarray().ravel()
+    # a death from a cause always mentions it, so that pair counts its deaths
+    # and the column every death mentioning it
+    if role == "underlying":
+        total = matrix[position, position]
+    else:
+        total = matrix.getcol(position).sum()
+    counts[position] = 0
+    top = np.argsort(-counts, kind="stable")[:n]
+    top = top[counts[top] > 0]
+    result = store["causes"].iloc[top].reset_index(drop=True)
+    result["deaths"] = counts[top].astype("int64")
+    result["share"] = result["deaths"] / total if total else np.nan
+    return result
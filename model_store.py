@@ -0,0 +1,121 @@
+"""fitted Prophet models kept on disk between monthly refreshes
+
+A model is stored per series, seasonality mode and fingerprint of the data it
+was fitted on. Fitting the same data again loads the stored model instead of
+running Stan, and fitting new data (a month appended, a provisional month
+revised) starts Stan from the parameters of the latest stored model of the
+series, which converges in far fewer iterations than a cold start:
+
+    model, how = model_store.fit("covid_deaths", train, "multiplicative")
+    # how is "stored", "warm" or "cold"
+
+forecast.run(store=True) fits through the store.
+"""
+
+import hashlib
+import os
+
+import numpy as np
+
+import snapshot
+
+try:
+    from prophet import Prophet
+    from prophet.serialize import model_from_json, model_to_json
+except ImportError:  # only needed to fit
+    Prophet = model_from_json = model_to_json = None
+
+MODEL_DIR = os.path.join(snapshot.SNAPSHOT_DIR, "models")
+KEEP = 3  # models kept per series and seasonality mode
+
+
+def data_fingerprint(df):
+    """hash of the ds and y columns a model is fitted on"""
+    digest = hashlib.sha1()
+    digest.update(df["ds"].to_numpy(dtype="datetime64[ns]").tobytes())
+    digest.update(df["y"].to_numpy(dtype="float64").tobytes())
+    return digest.hexdigest()[:16]
+
+
+def model_dir(series, seasonality_mode):
+    return os.path.join(MODEL_DIR, series, seasonality_mode)
+
+
+def stored_models(series, seasonality_mode):
+    """paths of the stored models of a series, newest first"""
+    folder = model_dir(series, seasonality_mode)
+    if not os.path.isdir(folder):
+        return []
+    paths = [
+        os.path.join(folder, name)
+        for name in os.listdir(folder)
+        if name.endswith(".json")
+    ]
+    return sorted(paths, key=os.path.getmtime, reverse=True)
+
+
+def load_model(path):
+    with open(path) as file:
+        return model_from_json(file.read())
+
+
+def save_model(model, series, seasonality_mode, fingerprint):
+    """write the model, then drop all but the KEEP newest of the series"""
+    folder = model_dir(series, seasonality_mode)
+    os.makedirs(folder, exist_ok=True)
+    path = os.path.join(folder, fingerprint + ".json")
+    tmp = path + ".tmp"
+    with open(tmp, "w") as file:
+        file.write(model_to_json(model))
+    os.replace(tmp, path)
+    for old in stored_models(series, seasonality_mode)[KEEP:]:
+        os.remove(old)
+
+
+def stan_init(model):
+    """a fitted model's parameters, as initial values for the next fit"""
+    init = {}
+    for name in ["k", "m", "sigma_obs"]:
+        init[name] = float(model.params[name][0][0])
+    for name in ["delta", "beta"]:
+        init[name] = np.asarray(model.params[name][0])
+    return init
+
+
+def fit(series, df, seasonality_mode="additive"):
+    """a Prophet model of series fitted on df (ds, y), reusing stored models
+
+    returns the model and how it was obtained: "stored" when this data was
+    fitted before, "warm" when started from an earlier model of the series,
+    "cold" otherwise
+    """
+    if Prophet is None:
+        raise ImportError("the model store needs prophet, pip install prophet")
+    fingerprint = data_fingerprint(df)
+    previous = stored_models(series, seasonality_mode)
+    for path in previous:
+        if os.path.basename(path) == fingerprint + ".json":
+            os.utime(path)  # keep it among the newest
+            return load_model(path), "stored"
+    model = None
+    if previous:
+        try:
+            init = stan_init(load_model(previous[0]))
+            model = Prophet(seasonality_mode=seasonality_mode).fit(df, init=init)
+            how = "warm"
+        except Exception:  # a stale or unreadable model only costs the warm start
+            model = None
+    if model is None:
+        model = Prophet(seasonality_mode=seasonality_mode).fit(df)
+        how = "cold"
+    save_model(model, series, seasonality_mode, fingerprint)
+    return model, how
+
+
+def clear_models(series=None):
+    """remove the stored models, of one series or all of them"""
+    folder = MODEL_DIR if series is None else os.path.join(MODEL_DIR, series)
+    for root, _, files in os.walk(folder, topdown=False):
+        for name in files:
+            os.remove(os.path.join(root, name))
+        os.rmdir(root)
@@ -0,0 +1,107 @@
+"""the wrangle stages as a graph of named nodes
+
+Each node names the wrangle.py function that builds it and the nodes whose
+results it takes as arguments. run() builds the requested nodes computing
+every node at most once and handing results downstream, so df2 no longer
+triggers several rebuilds of the merged table.
+
+    results, timings = pipeline.run("df2")
+    pipeline.print_graph(timings)
+"""
+
+import time
+
+import wrangle
+
+# node name -> (function building it, {argument name: node passed as it})
+NODES = {
+    "exports": (wrangle.get_exports, {}),
+    "deaths": (wrangle.prep_data, {"df": "exports"}),
+    "raw_population": (wrangle.get_population, {}),
+    "population": (wrangle.prep_pop_data, {"df": "raw_population"}),
+    "joined": (wrangle.merge_data, {"df": "deaths", "population": "population"}),
+    "merged": (wrangle.add_crude_rate, {"df": "joined"}),
+    "covid": (wrangle.prep_covid, {}),
+    "age_deaths": (wrangle.prep_age_deaths, {}),
+    "cause_counts": (wrangle.monthly_cause_counts, {"df": "merged"}),
+    "monthly_deaths": (
+        wrangle.get_monthly_deaths,
+        {"covid_all_ages": "covid", "cause_counts": "cause_counts"},
+    ),
+    "cause_deaths": (
+        wrangle.monthly_cause_deaths,
+        {"cause_counts": "cause_counts"},
+    ),
+    "df2": (
+        wrangle.make_df2,
+        {
+            "deaths_by_age": "age_deaths",
+            "monthly_deaths": "monthly_deaths",
+            "cause_counts": "cause_counts",
+            "cause_deaths": "cause_deaths",
+        },
+    ),
+}
+
+
+def dependencies(targets, built=()):
+    """every node needed for targets, upstream nodes first
+
+    nodes in built are already available, their inputs are not needed
+    """
+    order = []
+
+    def visit(name, path):
+        if name in order:
+            return
+        if name in built:
+            order.append(name)
+            return
+        if name in path:
+            raise ValueError("cycle in pipeline at node " + name)
+        if name not in NODES:
+            raise KeyError("unknown pipeline node " + name)
+        for upstream in NODES[name][1].values():
+            visit(upstream, path + [name])
+        order.append(name)
+
+    for target in targets:
+        visit(target, [])
+    return order
+
+
+def run(targets="df2", results=None):
+    """build the target node(s), computing each node at most once
+
+    results can hold already built nodes, e.g. {"merged": wrangle.wrangle_data()}
+    to start from the cached merged table, those nodes and everything only they
+    depend on are skipped. returns the dict of all node results and a dict of
+    seconds spent in each node that was computed
+    """
+    if isinstance(targets, str):
+        targets = [targets]
+    results = dict(results or {})
+    timings = {}
+    for name in dependencies(targets, built=results):
+        if name in results:
+            continue
+        func, upstream = NODES[name]
+        start = time.perf_counter()
+        results[name] = func(**{arg: results[up] for arg, up in upstream.items()})
+        timings[name] = time.perf_counter() - start
+    return results, timings
+
+
+def print_graph(timings=None):
+    """print the nodes upstream first, with their inputs and timings if given"""
+    timings = timings or {}
+    for name in dependencies(list(NODES)):
+        func, upstream = NODES[name]
+        line = "{:<16} {:<22}".format(name, func.__name__ + "()")
+        if upstream:
+            line += " <- " + ", ".join(upstream.values())
+        if name in timings:
+            line += "  [{:.1f} ms]".format(timings[name] * 1000)
+        print(line)
+    if timings:
+        print("total {:.1f} ms".format(sum(timings.values()) * 1000))
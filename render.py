@@ -0,0 +1,132 @@
+"""render the viz.py figures headless, in parallel, without the notebook
+
+The shared tables are built (and snapshotted) once in the parent process,
+then a process pool renders the figures with the Agg backend. Each worker
+starts from the parent's warm caches, or from the snapshots if processes
+are spawned rather than forked. A manifest.json with the files written and
+the render time of every figure is saved next to them.
+
+    python render.py                      # every figure as png into figures/
+    python render.py covid_vs_time gendered_deaths --format png svg
+"""
+
+import argparse
+import json
+import os
+import time
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+
+import matplotlib
+
+matplotlib.use("Agg")
+import matplotlib.pyplot as plt
+
+import cause_index
+import viz
+import wrangle
+
+# the figure functions in viz.py, in the order of the final report
+FIGURES = [
+    "death_rates_by_age_group",
+    "deaths_by_age_group",
+    "deaths_by_age_group_over_time",
+    "top_five_causes_over_time",
+    "top_ten_causes_over_time",
+    "covid_vs_time",
+    "deaths_by_age_group_with_avg",
+    "covid_deaths_vs_gender",
+    "covid_deaths_by_age_and_gender",
+    "monthly_avg_age_covid",
+    "monthly_avg_age_all_cause",
+    "monthly_scaled_deaths_cause_and_covid",
+    "monthly_avg_age_all_cause_and_covid",
+    "monthly_deaths_all_cause_and_covid",
+    "monthly_scaled_deaths_all_cause_and_covid",
+    "gendered_deaths",
+    "scaled_gendered_deaths",
+    "select_gendered_deaths",
+]
+
+
+def warm():
+    """build every table the figures share so workers only load them"""
+    wrangle.wrangle_data()
+    wrangle.prep_covid()
+    wrangle.prep_age_deaths()
+    cause_index.get_cause_index()
+
+
+def render_figure(name, out_dir, formats):
+    """draw one figure and save every figure it opened, returns its manifest entry"""
+    start = time.perf_counter()
+    entry = {"figure": name, "files": []}
+    try:
+        with warnings.catch_warnings():
+            # plt.show() is a no-op on Agg and warns about it
+            warnings.simplefilter("ignore")
+            getattr(viz, name)()
+        numbers = plt.get_fignums()
+        for position, number in enumerate(numbers):
+            stem = name if len(numbers) == 1 else "{}_{}".format(name, position + 1)
+            for fmt in formats:
+                path = os.path.join(out_dir, stem + "." + fmt)
+                plt.figure(number).savefig(path, bbox_inches="tight")
+                entry["files"].append(path)
+    except Exception as error:  # one broken figure shouldn't stop the batch
+        entry["error"] = repr(error)
+    finally:
+        plt.close("all")
+    entry["seconds"] = round(time.perf_counter() - start, 4)
+    return entry
+
+
+def render(figures="all", out_dir="figures", formats=("png",), workers=None):
+    """render figures ("all" or a list of FIGURES) across a process pool
+
+    returns the manifest, which is also written to out_dir/manifest.json
+    """
+    if figures == "all":
+        figures = FIGURES
+    unknown = [name for name in figures if name not in FIGURES]
+    if unknown:
+        raise ValueError("unknown figures: " + ", ".join(unknown))
+    os.makedirs(out_dir, exist_ok=True)
+    start = time.perf_counter()
+    warm()
+    data_seconds = time.perf_counter() - start
+    workers = workers or min(len(figures), os.cpu_count() or 1)
+    with ProcessPoolExecutor(max_workers=workers, initializer=warm) as executor:
+        entries = list(
+            executor.map(
+                render_figure,
+                figures,
+                [out_dir] * len(figures),
+                [formats] * len(figures),
+            )
+        )
+    manifest = {
+        "data_seconds": round(data_seconds, 4),
+        "total_seconds": round(time.perf_counter() - start, 4),
+        "workers": workers,
+        "figures": entries,
+    }
+    with open(os.path.join(out_dir, "manifest.json"), "w") as file:
+        json.dump(manifest, file, indent=2)
+    return manifest
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("figures", nargs="*", help="figures to render, default all")
+    parser.add_argument("--out", default="figures", help="output directory")
+    parser.add_argument(
+        "--format", nargs="+", default=["png"], help="png, svg, pdf, ..."
+    )
+    parser.add_argument("--workers", type=int, default=None)
+    args = parser.parse_args()
+    manifest = render(args.figures or "all", args.out, args.format, args.workers)
+    for entry in manifest["figures"]:
+        status = entry.get("error", ", ".join(entry["files"]))
+        print("{:<45} {:>8.3f}s  {}".format(entry["figure"], entry["seconds"], status))
+    print("total {:.2f}s".format(manifest["total_seconds"]))
@@ -0,0 +1,320 @@
+"""local HTTP service over the wrangled mortality data
+
+Loads the cleaned tables and the cube once, then answers GET requests for
+the aggregates the viz.py figures are drawn from, as JSON or Arrow. The
+pandas and NumPy work runs in a thread pool so the event loop keeps
+accepting requests, identical requests in flight share one computation, and
+responses are cached until a source file changes:
+
+    python service.py --port 8050
+    curl "localhost:8050/deaths?by=month,age_group&cause_code=GR113-137"
+    curl "localhost:8050/top_causes?n=5&gender=Female&month=2021-01-01"
+    curl "localhost:8050/average_age?table=covid&by=month,gender"
+    curl "localhost:8050/features?feature=rolling_mean_12&by=month,gender"
+    curl "localhost:8050/covid_vs_all?format=arrow" > covid_vs_all.arrow
+
+Only the standard library is needed, pyarrow for format=arrow. loadtest.py
+measures requests per second against a running service.
+"""
+
+import argparse
+import asyncio
+import io
+import json
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qsl, urlsplit
+
+import pandas as pd
+
+import ages
+import cause_index
+import cube
+import excess
+import features
+import snapshot
+import topn
+import wrangle
+
+HOST, PORT = "127.0.0.1", 8050
+WORKERS = 4
+RESPONSE_CACHE_SIZE = 256
+CONTENT_TYPES = {
+    "json": "application/json",
+    "arrow": "application/vnd.apache.arrow.stream",
+}
+
+_responses = OrderedDict()
+_pending = {}
+# the wrangle caches aren't thread safe, shared tables are fetched one at a time
+_data_lock = threading.Lock()
+
+
+def source_files():
+    return wrangle.list_files(".") + [
+        wrangle.POPULATION_FILE,
+        wrangle.COVID_FILE,
+        wrangle.AGE_DEATHS_FILE,
+    ]
+
+
+@wrangle.cached(source_files)
+def monthly_deaths():
+    """get_monthly_deaths(), built once per version of the source files"""
+    return wrangle.get_monthly_deaths()
+
+
+def data(name):
+    """a shared table: "cube", "cause_index", "covid", "age_deaths" or "monthly" """
+    loaders = {
+        "cube": cube.get_cube,
+        "cause_index": cause_index.get_cause_index,
+        "covid": wrangle.prep_covid,
+        "age_deaths": wrangle.prep_age_deaths,
+        "monthly": monthly_deaths,
+        "features": features.get_features,
+    }
+    with _data_lock:
+        return loaders[name]()
+
+
+def warm():
+    """load every shared table so the first requests don't pay for it"""
+    for name in ["cube", "cause_index", "covid", "age_deaths", "monthly", "features"]:
+        data(name)
+
+
+def split_list(params, name, default=None):
+    value = params.get(name)
+    if not value:
+        return default
+    return [part for part in value.split(",") if part]
+
+
+def cube_filters(params):
+    """cube.query filters from the query string"""
+    filters = {}
+    for axis in ["age_group", "gender"]:
+        if axis in params:
+            filters[axis] = split_list(params, axis)
+    if "month" in params:
+        try:
+            filters["month"] = list(pd.to_datetime(split_list(params, "month")))
+        except ValueError:
+            raise ValueError("month should look like 2021-01-01")
+    causes = None
+    if "cause" in params:
+        causes = split_list(params, "cause")
+    if "cause_code" in params:
+        entries = data("cause_index")["entries"]
+        codes = split_list(params, "cause_code")
+        unknown = [code for code in codes if code not in entries]
+        if unknown:
+            raise ValueError("unknown cause codes: " + ", ".join(unknown))
+        causes = (causes or []) + [entries[code]["cause"] for code in codes]
+    if "cause_like" in params:
+        causes = (causes or []) + cube.matching(
+            data("cube"), "cause", params["cause_like"]
+        )
+    if causes is not None:
+        filters["cause"] = causes
+    return filters
+
+
+def tidy(result, name):
+    """a query result as a flat frame"""
+    if isinstance(result, pd.DataFrame) and result.columns.name is not None:
+        result = result.stack()
+    if isinstance(result, pd.Series):
+        result = result.rename(name)
+    return result.reset_index()
+
+
+def deaths(params, measure="deaths"):
+    by = split_list(params, "by", ["month"])
+    result = cube.query(data("cube"), measure, by, **cube_filters(params))
+    return tidy(result, measure)
+
+
+def rates(params):
+    return deaths(params, "rate")
+
+
+def average_age(params):
+    table = params.get("table", "all")
+    if table not in ["all", "covid"]:
+        raise ValueError("table is all or covid")
+    df = data("age_deaths" if table == "all" else "covid")
+    # the age deaths export only has the gender code
+    by = [
+        "gender_code" if col == "gender" else col
+        for col in split_list(params, "by", ["month"])
+    ]
+    quantiles = [float(q) for q in split_list(params, "quantiles", ages.QUANTILES)]
+    return ages.age_summary(ages.age_histogram(df, by), quantiles).reset_index()
+
+
+def top_causes(params):
+    n = int(params.get("n", 10))
+    rank_by = params.get("rank_by", "deaths")
+    if rank_by not in ["deaths", "rate"]:
+        raise ValueError("rank_by is deaths or rate")
+    return topn.top_causes(
+        data("cube"), n, window="all", rank_by=rank_by, **cube_filters(params)
+    )
+
+
+def covid_vs_all(params):
+    return data("monthly").reset_index()
+
+
+def excess_deaths(params):
+    method = params.get("method", "seasonal")
+    result = excess.excess(data("cube"), method)
+    by = split_list(params, "by", ["month"])
+    return excess.summarize(result, by, **cube_filters(params)).reset_index()
+
+
+def feature_values(params):
+    name = params.get("feature", "trend")
+    if name not in features.ADDITIVE:
+        raise ValueError("feature is one of " + ", ".join(features.ADDITIVE))
+    by = split_list(params, "by", ["month"])
+    result = cube.query(data("features"), name, by, **cube_filters(params))
+    return tidy(result, name)
+
+
+ENDPOINTS = {
+    "/deaths": deaths,
+    "/rates": rates,
+    "/average_age": average_age,
+    "/top_causes": top_causes,
+    "/covid_vs_all": covid_vs_all,
+    "/excess": excess_deaths,
+    "/features": feature_values,
+}
+
+
+def encode(df, fmt):
+    """the frame as JSON records or an Arrow IPC stream"""
+    if fmt == "json":
+        return df.to_json(orient="records", date_format="iso").encode()
+    if snapshot.pa is None:
+        raise ValueError("format=arrow needs pyarrow")
+    table = snapshot.pa.Table.from_pandas(df, preserve_index=False)
+    sink = io.BytesIO()
+    with snapshot.pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue()
+
+
+def respond(path, params):
+    """status, content type and body of a request, run in the thread pool"""
+    if path == "/":
+        return 200, "application/json", json.dumps(sorted(ENDPOINTS)).encode()
+    if path not in ENDPOINTS:
+        return 404, "text/plain", b"not found"
+    fmt = params.pop("format", "json")
+    if fmt not in CONTENT_TYPES:
+        return 400, "text/plain", b"format is json or arrow"
+    try:
+        body = encode(ENDPOINTS[path](params), fmt)
+    except (KeyError, ValueError) as error:
+        return 400, "text/plain", str(error).encode()
+    return 200, CONTENT_TYPES[fmt], body
+
+
+async def cached_response(loop, executor, path, params):
+    """the response from the cache, an identical request in flight, or the pool"""
+    fingerprint = wrangle.file_fingerprint(source_files())
+    key = (path, tuple(sorted(params.items())), fingerprint)
+    if key in _responses:
+        _responses.move_to_end(key)
+        return _responses[key]
+    if key not in _pending:
+        _pending[key] = loop.run_in_executor(executor, respond, path, dict(params))
+    try:
+        response = await asyncio.shield(_pending[key])
+    finally:
+        _pending.pop(key, None)
+    if response[0] == 200:
+        _responses[key] = response
+        while len(_responses) > RESPONSE_CACHE_SIZE:
+            _responses.popitem(last=False)
+    return response
+
+
+async def handle(reader, writer, executor):
+    """serve GET requests on one connection, keeping it alive when asked"""
+    loop = asyncio.get_running_loop()
+    try:
+        while True:
+            request = await reader.readline()
+            if not request:
+                break
+            headers = {}
+            while True:
+                line = await reader.readline()
+                if line in (b"\r\n", b"\n", b""):
+                    break
+                name, _, value = line.decode("latin-1").partition(":")
+                headers[name.strip().lower()] = value.strip()
+            method, target, version = (request.decode("latin-1").split() + ["", ""])[:3]
+            if method != "GET":
+                status, content_type, body = 405, "text/plain", b"only GET"
+            else:
+                url = urlsplit(target)
+                params = dict(parse_qsl(url.query))
+                status, content_type, body = await cached_response(
+                    loop, executor, url.path, params
+                )
+            keep_alive = (
+                headers.get("connection", "").lower() != "close"
+                and version == "HTTP/1.1"
+            )
+            writer.write(
+                "HTTP/1.1 {} {}\r\nContent-Type: {}\r\nContent-Length: {}\r\n"
+                "Connection: {}\r\n\r\n".format(
+                    status,
+                    {200: "OK", 400: "Bad Request", 404: "Not Found"}.get(
+                        status, "Error"
+                    ),
+                    content_type,
+                    len(body),
+                    "keep-alive" if keep_alive else "close",
+                ).encode()
+                + body
+            )
+            await writer.drain()
+            if not keep_alive:
+                break
+    except (ConnectionError, asyncio.IncompleteReadError):
+        pass
+    finally:
+        writer.close()
+
+
+async def serve(host=HOST, port=PORT, workers=WORKERS):
+    """load the tables, then serve until cancelled"""
+    executor = ThreadPoolExecutor(max_workers=workers)
+    loop = asyncio.get_running_loop()
+    await loop.run_in_executor(executor, warm)
+    server = await asyncio.start_server(
+        lambda reader, writer: handle(reader, writer, executor), host, port
+    )
+    print("serving on http://{}:{}".format(host, port))
+    async with server:
+        await server.serve_forever()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default=HOST)
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--workers", type=int, default=WORKERS)
+    args = parser.parse_args()
+    try:
+        asyncio.run(serve(args.host, args.port, args.workers))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,192 @@
+"""on-disk columnar snapshots of the wrangled CDC WONDER tables
+
+The cleaned tables are written as uncompressed Feather (Arrow IPC) files so a
+fresh process can memory-map them instead of re-parsing the .txt exports.
+Each snapshot records the fingerprint of the source files it was built from
+and is ignored (and rebuilt by wrangle.py) as soon as a source file changes.
+"""
+
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    from pyarrow import feather
+except ImportError:  # snapshots are only an optimization, parse the files instead
+    pa = None
+
+SNAPSHOT_DIR = ".snapshots"
+# bump when the cleaned schema changes so old snapshots are rebuilt
+SNAPSHOT_VERSION = 1
+
+# columns stored as categoricals, they repeat the same few strings on every row
+CATEGORY_COLUMNS = ["cause", "cause_code", "gender", "age_group", "year"]
+# counts that comfortably fit in 32 bits
+INT32_COLUMNS = ["deaths", "age", "deaths_times_age"]
+# categories of compact() frames by column, shared between all of them
+_dictionaries = {}
+
+
+def to_typed(df):
+    """convert a cleaned table to the compact dtypes used for snapshots"""
+    df = df.copy()
+    for col in CATEGORY_COLUMNS:
+        if col in df.columns:
+            df[col] = df[col].astype("category")
+    for col in INT32_COLUMNS:
+        if col in df.columns:
+            df[col] = df[col].astype("int32")
+    if "month" in df.columns:
+        df["month"] = pd.to_datetime(df["month"])
+    return df
+
+
+def shared_categorical(col, values):
+    """values as a categorical over a dictionary shared by every compact frame
+
+    frames held side by side then point at one copy of each dictionary
+    instead of each keeping its own
+    """
+    categorical = isinstance(values.dtype, pd.CategoricalDtype)
+    if categorical:
+        seen = values.cat.categories
+    else:
+        seen = pd.Index(values.dropna().unique())
+    dtype = _dictionaries.get(col)
+    if dtype is None or not seen.isin(dtype.categories).all():
+        categories = seen if dtype is None else dtype.categories.union(seen)
+        dtype = pd.CategoricalDtype(categories)
+        _dictionaries[col] = dtype
+    if not categorical:
+        return values.astype(dtype)
+    # astype is a no-op for equal categories, so recode onto the shared ones
+    mapping = dtype.categories.get_indexer(values.cat.categories)
+    codes = values.cat.codes.to_numpy()
+    codes = np.where(codes >= 0, mapping[codes], -1)
+    return pd.Series(
+        pd.Categorical.from_codes(codes, dtype=dtype),
+        index=values.index,
+        name=values.name,
+    )
+
+
+def compact(df):
+    """shrink a typed table for holding many of them in memory
+
+    text columns become categoricals over shared dictionaries, integer
+    columns the smallest type their values fit in and floats float32.
+    sums and arithmetic on the narrow int columns can stay in their type and
+    overflow, so aggregating code upcasts them to int64 first
+    """
+    df = df.copy(deep=False)
+    for col in df.columns:
+        dtype = df[col].dtype
+        if col in CATEGORY_COLUMNS or dtype == object or dtype == "string":
+            df[col] = shared_categorical(col, df[col])
+        elif pd.api.types.is_integer_dtype(dtype):
+            df[col] = pd.to_numeric(df[col], downcast="integer")
+        elif pd.api.types.is_float_dtype(dtype):
+            df[col] = df[col].astype("float32")
+    return df
+
+
+def memory_report(df):
+    """bytes per column of df as plain strings, as typed and as compact()
+
+    each form is converted from the plain one, so df can be in any of them
+    """
+    plain = {}
+    for col in df.columns:
+        dtype = df[col].dtype
+        if isinstance(dtype, pd.CategoricalDtype):
+            plain[col] = object
+        elif pd.api.types.is_integer_dtype(dtype):
+            plain[col] = "int64"
+        elif pd.api.types.is_float_dtype(dtype):
+            plain[col] = "float64"
+    strings = df.astype(plain)
+    typed = to_typed(strings)
+    report = pd.DataFrame(
+        {
+            "strings": strings.memory_usage(deep=True, index=False),
+            "typed": typed.memory_usage(deep=True, index=False),
+            "compact": compact(typed).memory_usage(deep=True, index=False),
+        }
+    )
+    report.loc["total"] = report.sum()
+    return report
+
+
+def concat_typed(frames):
+    """concatenate typed tables, keeping categoricals with different categories
+
+    pd.concat falls back to object columns unless the categories match, so
+    the categories are unioned first which only recodes the integer codes
+    """
+    frames = [df for df in frames if len(df)]
+    if not frames:
+        return pd.DataFrame()
+    frames = [df.copy(deep=False) for df in frames]
+    for col in CATEGORY_COLUMNS:
+        if col not in frames[0].columns:
+            continue
+        categories = pd.Index([])
+        for df in frames:
+            categories = categories.union(df[col].cat.categories, sort=False)
+        for df in frames:
+            df[col] = df[col].cat.set_categories(categories)
+    return pd.concat(frames, ignore_index=True)
+
+
+def snapshot_path(name):
+    """where the snapshot for a table lives"""
+    return os.path.join(SNAPSHOT_DIR, name + ".feather")
+
+
+def _metadata(fingerprint):
+    """metadata stored with the snapshot to decide whether it is still fresh"""
+    return json.dumps({"version": SNAPSHOT_VERSION, "sources": fingerprint})
+
+
+def load_snapshot(name, fingerprint):
+    """memory-map a snapshot, returns None if it is missing or stale"""
+    path = snapshot_path(name)
+    if pa is None or not os.path.exists(path):
+        return None
+    try:
+        table = feather.read_table(path, memory_map=True)
+    except (OSError, pa.ArrowInvalid):
+        return None
+    metadata = table.schema.metadata or {}
+    if metadata.get(b"wrangle") != _metadata(fingerprint).encode():
+        return None
+    # split_blocks lets numeric columns stay backed by the mapped file
+    return table.to_pandas(split_blocks=True)
+
+
+def save_snapshot(name, df, fingerprint):
+    """write a snapshot of df built from the files in fingerprint"""
+    if pa is None:
+        return
+    path = snapshot_path(name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    table = pa.Table.from_pandas(df)
+    metadata = dict(table.schema.metadata or {})
+    metadata[b"wrangle"] = _metadata(fingerprint).encode()
+    table = table.replace_schema_metadata(metadata)
+    # write to a temporary file first so readers never see half a snapshot
+    feather.write_feather(table, path + ".tmp", compression="uncompressed")
+    os.replace(path + ".tmp", path)
+
+
+def clear_snapshots():
+    """delete every snapshot so the next load re-parses the source files"""
+    if not os.path.isdir(SNAPSHOT_DIR):
+        return
+    for root, dirs, files in os.walk(SNAPSHOT_DIR):
+        for file in files:
+            if file.endswith(".feather"):
+                os.remove(os.path.join(root, file))
@@ -0,0 +1,139 @@
+"""age-adjusted death rates by the direct method
+
+crude_rate compares groups with different age structures, and summing the
+population column over rows (as top_ten_causes_over_time does) counts the
+same people once per cause. Here deaths and population come from the arrays
+of cube.py, where population has no cause axis, and each group's age-specific
+rates are weighted by a standard population:
+
+    standardize.age_adjusted_rates()                       # every cause x month
+    standardize.age_adjusted_rates(by=("gender",), period="year")
+    standardize.age_adjusted_rates(by=("cause", "gender"), causes=covid)
+
+Rates are per 100,000 by default, monthly rates for months and yearly for
+years (a year still in progress only counts the months it has so far). The
+confidence intervals use the Poisson variance of the deaths.
+"""
+
+import numpy as np
+import pandas as pd
+
+import cube
+import excess
+
+# 2000 U.S. standard population (per million) in the WONDER ten-year age groups
+US_2000 = {
+    "01": 13_818,
+    "01-04": 55_317,
+    "05-14": 145_565,
+    "15-24": 138_646,
+    "25-34": 135_573,
+    "35-44": 162_613,
+    "45-54": 134_834,
+    "55-64": 87_247,
+    "65-74": 66_037,
+    "75-84": 44_842,
+    "85+": 15_508,
+}
+PER = 100_000
+
+
+def standard_weights(age_groups, standard=US_2000):
+    """weight of each age group, renormalised over the groups the data has"""
+    weights = np.array([standard.get(age, 0) for age in age_groups], dtype="float64")
+    if weights.sum() == 0:
+        raise ValueError("the standard population covers none of the age groups")
+    return weights / weights.sum()
+
+
+def by_period(data, period):
+    """deaths and population arrays with the month axis turned into periods
+
+    for years deaths are summed and population averaged over the months with
+    an estimate, a month without one (0) doesn't pull the mean down
+    """
+    months = pd.DatetimeIndex(data["axes"]["month"])
+    deaths, population = data["deaths"], data["population"]
+    if period == "month":
+        return deaths, population, pd.Index(months, name="month")
+    if period != "year":
+        raise ValueError("period is month or year, not " + str(period))
+    years, codes = np.unique(months.year, return_inverse=True)
+    members = np.zeros((len(months), len(years)))
+    members[np.arange(len(months)), codes] = 1
+    deaths = np.moveaxis(np.tensordot(deaths, members, axes=([0], [0])), -1, 0)
+    known = np.tensordot(population > 0, members, axes=([0], [0]))
+    total = np.tensordot(population, members, axes=([0], [0]))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        population = np.moveaxis(np.where(known > 0, total / known, 0.0), -1, 0)
+    return deaths, population, pd.Index(years, name="year")
+
+
+def age_adjusted_rates(
+    data=None,
+    by=("cause",),
+    period="month",
+    standard=US_2000,
+    causes=None,
+    level=0.95,
+    per=PER,
+):
+    """crude and age-adjusted rates per period and each combination of by
+
+    by is any of "cause" and "gender", left out axes are summed (all causes,
+    both genders). causes limits the causes considered. returns a DataFrame
+    indexed by period and by with deaths, population, crude_rate,
+    age_adjusted_rate and its confidence interval
+    """
+    if data is None:
+        data = cube.get_cube()
+    by = list(by)
+    unknown = [axis for axis in by if axis not in ["cause", "gender"]]
+    if unknown:
+        raise ValueError(
+            "can only standardize by cause and gender, not {}".format(unknown)
+        )
+    deaths, population, periods = by_period(data, period)
+    cause_labels = data["axes"]["cause"]
+    if causes is not None:
+        positions = cause_labels.get_indexer(causes)
+        if (positions < 0).any():
+            raise KeyError("unknown causes: {}".format(causes))
+        deaths = deaths.take(positions, axis=3)
+        cause_labels = cause_labels[positions]
+    # axes are now (period, age_group, gender, cause)
+    if "cause" not in by:
+        deaths = deaths.sum(axis=3, keepdims=True)
+    if "gender" not in by:
+        deaths = deaths.sum(axis=2, keepdims=True)
+        population = population.sum(axis=2, keepdims=True)
+    population = population[..., None]
+    weights = standard_weights(data["axes"]["age_group"], standard)[None, :, None, None]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        rates = np.where(population > 0, deaths / population, 0.0)
+        variances = np.where(population > 0, deaths / population**2, 0.0)
+    adjusted = (weights * rates).sum(axis=1) * per
+    margin = excess.z_value(level) * np.sqrt((weights**2 * variances).sum(axis=1)) * per
+    total_deaths = deaths.sum(axis=1)
+    total_population = np.broadcast_to(population.sum(axis=1), total_deaths.shape)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        crude = np.where(
+            total_population > 0, total_deaths / total_population * per, np.nan
+        )
+    # summed axes have length one, so raveling follows the order of the labels
+    labels = [periods]
+    if "gender" in by:
+        labels.append(data["axes"]["gender"])
+    if "cause" in by:
+        labels.append(pd.Index(cause_labels, name="cause"))
+    return pd.DataFrame(
+        {
+            "deaths": np.ravel(total_deaths),
+            "population": np.ravel(total_population),
+            "crude_rate": np.ravel(crude),
+            "age_adjusted_rate": np.ravel(adjusted),
+            "lower": np.clip(np.ravel(adjusted - margin), 0, None),
+            "upper": np.ravel(adjusted + margin),
+        },
+        index=pd.MultiIndex.from_product(labels),
+    )
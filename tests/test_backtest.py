@@ -0,0 +1,29 @@
+from functools import partial
+
+import numpy as np
+import pytest
+
+import backtest
+
+
+def test_min_train_shorter_than_a_season_is_rejected():
+    values = np.arange(48, dtype="float64")[:, None]
+    with pytest.raises(ValueError):
+        backtest.forecast_cube(values, backtest.MODELS, 3, backtest.SEASON - 1)
+
+
+def test_min_train_shorter_than_a_window_is_rejected():
+    values = np.arange(48, dtype="float64")[:, None]
+    models = {"moving_average": partial(backtest.moving_average, window=18)}
+    with pytest.raises(ValueError):
+        backtest.forecast_cube(values, models, 3, backtest.SEASON)
+    backtest.forecast_cube(values, models, 3, 18)
+
+
+def test_forecasts_only_use_months_before_the_origin():
+    values = np.arange(48, dtype="float64")[:, None]
+    forecasts, _, origins = backtest.forecast_cube(
+        values, backtest.MODELS, 3, backtest.SEASON
+    )
+    for name in ["last_value", "moving_average", "seasonal_naive"]:
+        assert (forecasts[name][:, :, 0] < origins[:, None]).all()
@@ -0,0 +1,23 @@
+import pandas as pd
+import pytest
+
+import cause_index
+
+
+def table():
+    labels = {
+        "GR113-137": "#COVID-19 (U07.1)",
+        "GR113-076": "#Influenza and pneumonia (J09-J18)",
+    }
+    codes = pd.Series(["GR113-137", "GR113-076", "GR113-137", "GR113-076"])
+    return pd.DataFrame({"cause_code": codes, "cause": codes.map(labels)})
+
+
+def test_select_checks_the_table():
+    df = table()
+    index = cause_index.build_cause_index(df)
+    assert list(cause_index.select(df, index, icd="U07.1").index) == [0, 2]
+    assert len(cause_index.select(df.astype("category"), index, icd="J10")) == 2
+    # same size, other order
+    with pytest.raises(ValueError):
+        cause_index.select(df.iloc[[1, 0, 2, 3]], index, icd="U07.1")
@@ -0,0 +1,41 @@
+import pandas as pd
+
+import cube
+
+
+def population():
+    return pd.DataFrame(
+        {
+            "year": ["2020"] * 4,
+            "age_group": ["01", "01", "85+", "85+"],
+            "gender": ["Female", "Male", "Female", "Male"],
+            "population": ["1000", "1100", "2000", "1500"],
+        }
+    )
+
+
+def deaths():
+    # no deaths of males aged 85+ in February
+    return pd.DataFrame(
+        {
+            "month": pd.to_datetime(["2020-01-01"] * 4 + ["2020-02-01"] * 3),
+            "age_group": ["01", "01", "85+", "85+", "01", "01", "85+"],
+            "gender": ["Female", "Male", "Female", "Male", "Female", "Male", "Female"],
+            "cause": ["a", "a", "b", "b", "a", "b", "b"],
+            "deaths": [1, 2, 3, 4, 5, 6, 7],
+            "crude_rate": [0.0] * 7,
+        }
+    )
+
+
+def test_population_of_cells_without_deaths():
+    data = cube.build_cube(deaths(), population())
+    february = cube.query(
+        data,
+        "population",
+        by=("age_group", "gender"),
+        month=[pd.Timestamp("2020-02-01")],
+    )
+    assert february.loc["85+", "Male"] == 1500
+    assert cube.query(data, "population", by=("month",)).tolist() == [5600, 5600]
+    assert cube.query(data, "rate", by=("month",)).tolist() == [10 / 5600, 18 / 5600]
@@ -0,0 +1,119 @@
+import pandas as pd
+
+import cause_index
+import mcd
+import wrangle
+
+
+def chunk():
+    """a cleaned MCD chunk with the catch-all infectious group listed before COVID-19"""
+    other = (
+        "Other and unspecified infectious and parasitic diseases and their "
+        "sequelae (A00,A05,A20-A36,B99,U07.1)"
+    )
+    covid = "#COVID-19 (U07.1)"
+    flu = "#Influenza and pneumonia (J09-J18)"
+    rows = [
+        ("GR113-018", other, "GR113-018", other, 5),
+        ("GR113-137", covid, "GR113-137", covid, 40),
+        ("GR113-137", covid, "GR113-076", flu, 12),
+        ("GR113-076", flu, "GR113-137", covid, 3),
+    ]
+    df = pd.DataFrame(
+        rows, columns=["cause_code", "cause", "mentioned_code", "mentioned", "deaths"]
+    )
+    df["month"] = "2021/01"
+    df["age_group"] = "85+"
+    df["gender"] = "Female"
+    return df
+
+
+def store():
+    state = mcd.new_state()
+    mcd.add_labels(state, chunk())
+    mcd.add_chunk(state, chunk())
+    return mcd.finish(state)
+
+
+def test_u071_resolves_to_covid():
+    data = store()
+    position = mcd.resolve(data, "U07.1")
+    assert data["causes"]["code"][position] == cause_index.COVID_CODE
+
+
+def test_co_occurring_with_covid():
+    result = mcd.co_occurring(store(), "U07.1", year=2021, age_group="85+")
+    assert list(result["code"]) == ["GR113-076"]
+    assert list(result["deaths"]) == [12]
+
+
+HEADER = [
+    "Notes",
+    "Ten-Year Age Groups",
+    "Ten-Year Age Groups Code",
+    "Gender",
+    "Gender Code",
+    "Month",
+    "Month Code",
+    "UCD - ICD-10 113 Cause List",
+    "UCD - ICD-10 113 Cause List Code",
+    "MCD - ICD-10 113 Cause List",
+    "MCD - ICD-10 113 Cause List Code",
+    "Deaths",
+]
+COVID = ("#COVID-19 (U07.1)", "GR113-137")
+FLU = ("#Influenza and pneumonia (J09-J18)", "GR113-076")
+
+
+def export(path, rows):
+    """write rows of (age code, month code, underlying, mentioned, deaths) like WONDER"""
+    lines = ["\t".join('"{}"'.format(column) for column in HEADER)]
+    for age, month, cause, mentioned, deaths in rows:
+        fields = ["", age, age, "Female", "F", month, month]
+        fields += list(cause) + list(mentioned)
+        lines.append(
+            "\t".join('"{}"'.format(field) for field in fields) + "\t" + deaths
+        )
+    lines += ['"---"', '"Dataset: Provisional Mortality"', '"---"']
+    path.write_text("\n".join(lines) + "\n")
+
+
+def test_finish_without_rows():
+    data = mcd.finish(mcd.new_state())
+    assert data["matrix"].shape == (0, 0)
+    assert len(data["slices"]) == 0 and len(data["causes"]) == 0
+
+
+def test_exports_round_trip(tmp_path, monkeypatch):
+    export(
+        tmp_path / "Multiple Cause of Death, 2021.txt",
+        [
+            ("1", "2021/01", COVID, COVID, "40"),
+            ("1", "2021/01", COVID, FLU, "12"),
+            ("1", "2021/01", FLU, COVID, "Suppressed"),
+            ("85+", "2021/02", FLU, FLU, "7"),
+        ],
+    )
+    export(
+        tmp_path / "Multiple Cause of Death, 2021 part 2.txt",
+        [("1", "2021/01", COVID, FLU, "3"), ("85+", "2021/02", FLU, COVID, "2")],
+    )
+    monkeypatch.chdir(tmp_path)
+    # a chunk per row and a fold after every second chunk
+    monkeypatch.setattr(mcd, "FOLD_PARTS", 1)
+    data = mcd.read_mcd(chunksize=1)
+    assert list(data["causes"]["code"]) == ["GR113-076", "GR113-137"]
+    assert list(data["slices"]["age_group"]) == ["01", "85+"]
+    assert data["slices"]["month"].tolist() == list(
+        pd.to_datetime(["2021-01-01", "2021-02-01"])
+    )
+    assert data["matrix"].toarray().tolist() == [[0, 0], [15, 40], [7, 2], [0, 0]]
+
+    stored = mcd.get_mcd()
+    assert (stored["matrix"] != data["matrix"]).nnz == 0
+    fingerprint = wrangle.file_fingerprint(mcd.list_mcd_files("."))
+    loaded = mcd.load_mcd(fingerprint)
+    assert (loaded["matrix"] != data["matrix"]).nnz == 0
+    pd.testing.assert_frame_equal(loaded["slices"], data["slices"])
+    pd.testing.assert_frame_equal(loaded["causes"], data["causes"])
+    assert mcd.load_mcd("another fingerprint") is None
@@ -0,0 +1,37 @@
+import numpy as np
+import pandas as pd
+
+import standardize
+
+
+def data():
+    # two age groups, one gender and cause, 2021-02 has no estimate for "85+"
+    months = pd.DatetimeIndex(["2020-01-01", "2020-02-01", "2021-01-01", "2021-02-01"])
+    deaths = np.array([[10, 20], [30, 40], [50, 60], [70, 80]], dtype="float64")
+    population = np.array(
+        [[1000, 400], [1000, 600], [2000, 500], [2000, 0]], dtype="float64"
+    )
+    return {
+        "axes": {
+            "month": pd.Index(months, name="month"),
+            "age_group": pd.Index(["01", "85+"], name="age_group"),
+            "gender": pd.Index(["Female"], name="gender"),
+            "cause": pd.Index(["a"], name="cause"),
+        },
+        "deaths": deaths[:, :, None, None],
+        "population": population[:, :, None],
+    }
+
+
+def test_yearly_rates_by_hand():
+    rates = standardize.age_adjusted_rates(data(), by=(), period="year", per=1)
+    weights = np.array([13_818, 15_508]) / (13_818 + 15_508)
+    # deaths over the year, population averaged over the months with an estimate
+    expected = {
+        2020: weights @ [40 / 1000, 60 / 500],
+        2021: weights @ [120 / 2000, 140 / 500],
+    }
+    for year, rate in expected.items():
+        assert np.isclose(rates.loc[year, "age_adjusted_rate"].item(), rate)
+    assert rates.loc[2021, "population"].item() == 2500
+    assert np.isclose(rates.loc[2021, "crude_rate"].item(), 260 / 2500)
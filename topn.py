@@ -0,0 +1,207 @@
+"""top causes of death by deaths or rate, for every period and slice at once
+
+The cube's (month, age_group, gender, cause) arrays are summed into windows
+(single months, calendar years, rolling 12 months or the whole span) and
+into the requested demographic slices, then argpartition picks the top n
+causes of every (period, slice) row together, only sorting those n:
+
+    topn.top_causes(n=5)                                    # per month
+    topn.top_causes(n=10, window="rolling12", by=("gender", "age_group"))
+    topn.top_causes(n=10, window="all", rank_by="rate")
+    topn.top_causes(n=5, window="all", gender="Female", month=[...])
+
+stream_top_causes() keeps the top n per month as chunks of the exports are
+read, for files too large to load (see wrangle.read_chunks).
+"""
+
+import heapq
+
+import numpy as np
+import pandas as pd
+
+import cube
+import standardize
+import wrangle
+
+WINDOWS = ["month", "year", "rolling12", "all"]
+
+
+def windowed(data, window):
+    """deaths and mean population arrays with the month axis turned into windows
+
+    returns deaths over (window, age_group, gender, cause), population over
+    (window, age_group, gender) and the labels of the windows
+    """
+    months = pd.DatetimeIndex(data["axes"]["month"])
+    deaths, population = data["deaths"], data["population"]
+    if window == "month":
+        return deaths, population, pd.Index(months, name="month")
+    if window == "rolling12":
+        if len(months) < 12:
+            raise ValueError("rolling12 needs at least 12 months")
+        # window sums from differences of cumulative sums, ending at each month
+        deaths = np.cumsum(deaths, axis=0)
+        deaths = np.concatenate([deaths[11:12], deaths[12:] - deaths[:-12]])
+        population = np.cumsum(population, axis=0)
+        population = np.concatenate(
+            [population[11:12], population[12:] - population[:-12]]
+        )
+        return deaths, population / 12, pd.Index(months[11:], name="ending")
+    if window == "year":
+        labels, codes = np.unique(months.year, return_inverse=True)
+        labels = pd.Index(labels, name="year")
+    elif window == "all":
+        codes = np.zeros(len(months), dtype=int)
+        labels = pd.Index(
+            ["{:%Y-%m} to {:%Y-%m}".format(months.min(), months.max())], name="period"
+        )
+    else:
+        raise ValueError("window is one of {}".format(WINDOWS))
+    members = np.zeros((len(months), len(labels)))
+    members[np.arange(len(months)), codes] = 1
+    deaths = np.moveaxis(np.tensordot(deaths, members, axes=([0], [0])), -1, 0)
+    members /= members.sum(axis=0)
+    population = np.moveaxis(np.tensordot(population, members, axes=([0], [0])), -1, 0)
+    return deaths, population, labels
+
+
+def sliced(data, filters):
+    """the cube narrowed to the labels filters pick, as in cube.query()
+
+    population has no cause axis, so it isn't narrowed by cause
+    """
+    if not filters:
+        return data
+    deaths, labels = cube._select(data, "deaths", cube.AXES, filters, {})
+    population_filters = {k: v for k, v in filters.items() if k != "cause"}
+    population, _ = cube._select(
+        data, "population", cube.POPULATION_AXES, population_filters, {}
+    )
+    return {
+        "axes": dict(zip(cube.AXES, labels)),
+        "deaths": deaths,
+        "population": population,
+    }
+
+
+def top_indices(values, n):
+    """positions of the n largest values along the last axis, largest first"""
+    n = min(n, values.shape[-1])
+    top = np.argpartition(-values, n - 1, axis=-1)[..., :n]
+    order = np.argsort(
+        -np.take_along_axis(values, top, axis=-1), axis=-1, kind="stable"
+    )
+    return np.take_along_axis(top, order, axis=-1)
+
+
+def top_causes(
+    data=None, n=10, window="month", by=(), rank_by="deaths", per=None, **filters
+):
+    """the n top causes of every window and slice of by (gender, age_group)
+
+    rank_by is "deaths" or "rate", the rate is per 100,000 of the slice's
+    mean population over the window. filters pick labels of an axis as in
+    cube.query(). returns a tidy DataFrame with a row per window, slice and
+    rank
+    """
+    if data is None:
+        data = cube.get_cube()
+    if rank_by not in ["deaths", "rate"]:
+        raise ValueError("rank_by is deaths or rate")
+    per = per or standardize.PER
+    by = list(by)
+    unknown = [axis for axis in by if axis not in ["gender", "age_group"]]
+    if unknown:
+        raise ValueError(
+            "top causes can be sliced by gender and age_group, not {}".format(unknown)
+        )
+    data = sliced(data, filters)
+    deaths, population, periods = windowed(data, window)
+    # axes are (window, age_group, gender, cause), sum away the slices not asked for
+    labels = [periods]
+    for axis, position in [("age_group", 1), ("gender", 2)]:
+        if axis not in by:
+            deaths = deaths.sum(axis=position, keepdims=True)
+            population = population.sum(axis=position, keepdims=True)
+    for axis in ["age_group", "gender"]:
+        if axis in by:
+            labels.append(data["axes"][axis])
+    with np.errstate(divide="ignore", invalid="ignore"):
+        rates = np.where(
+            population[..., None] > 0, deaths / population[..., None] * per, np.nan
+        )
+    ranked = deaths if rank_by == "deaths" else np.nan_to_num(rates, nan=-1)
+    top = top_indices(ranked, n)
+    # one row per (window, slice, rank)
+    cells = deaths.shape[:3]
+    n = top.shape[-1]
+    index = [i.ravel() for i in np.indices(cells + (n,))]
+    flat_top = top.ravel()
+    frame = pd.DataFrame({"period": labels[0][index[0]]})
+    frame = frame.rename(columns={"period": labels[0].name})
+    if "age_group" in by:
+        frame["age_group"] = data["axes"]["age_group"][index[1]]
+    if "gender" in by:
+        frame["gender"] = data["axes"]["gender"][index[2]]
+    frame["rank"] = index[3] + 1
+    frame["cause"] = data["axes"]["cause"][flat_top]
+    frame["deaths"] = deaths[index[0], index[1], index[2], flat_top]
+    frame["rate"] = rates[index[0], index[1], index[2], flat_top]
+    # slices without any deaths have nothing to rank
+    return frame[frame["deaths"] > 0].reset_index(drop=True)
+
+
+def new_stream(n=10, by=()):
+    """the state of a streaming top n, a heap per (month, slice)"""
+    return {"n": n, "by": list(by), "totals": {}, "heaps": {}, "members": {}}
+
+
+def update(state, chunk):
+    """add a chunk of cleaned rows (wrangle.clean_export) to the running top n
+
+    deaths only ever add up, so a cause can only enter a heap by passing its
+    smallest entry and never drops out of it, each heap stays exact
+    """
+    keys = ["month"] + state["by"]
+    grouped = chunk.groupby(keys + ["cause"], observed=True)["deaths"].sum()
+    n = state["n"]
+    for labels, deaths in grouped.items():
+        key, cause = labels[:-1], labels[-1]
+        totals = state["totals"].setdefault(key, {})
+        heap = state["heaps"].setdefault(key, [])
+        members = state["members"].setdefault(key, set())
+        total = totals.get(cause, 0) + int(deaths)
+        totals[cause] = total
+        if cause in members:
+            # its entry only grew, update it and restore the heap order
+            heap[[entry[1] for entry in heap].index(cause)] = (total, cause)
+            heapq.heapify(heap)
+        elif len(heap) < n:
+            heapq.heappush(heap, (total, cause))
+            members.add(cause)
+        elif total > heap[0][0]:
+            members.discard(heapq.heapreplace(heap, (total, cause))[1])
+            members.add(cause)
+    return state
+
+
+def ranking(state):
+    """the current top n of every (month, slice), as top_causes() returns them"""
+    rows = []
+    for key, heap in sorted(state["heaps"].items()):
+        for rank, (deaths, cause) in enumerate(sorted(heap, reverse=True), 1):
+            rows.append(key + (rank, cause, deaths))
+    return pd.DataFrame(
+        rows, columns=["month"] + state["by"] + ["rank", "cause", "deaths"]
+    )
+
+
+def stream_top_causes(files=None, n=10, by=(), chunksize=wrangle.CHUNKSIZE):
+    """the top n causes per month of the yearly exports, read chunk by chunk"""
+    if files is None:
+        files = sorted(wrangle.list_files("."))
+    state = new_stream(n, by)
+    for file in files:
+        for chunk in wrangle.read_chunks(file, wrangle.clean_export, chunksize):
+            update(state, chunk)
+    return ranking(state)
@@ -10,20 +10,37 @@ from matplotlib import style
 style.use("ggplot")
 import os
 import wrangle
+import cause_index
+import topn
 import datetime as dt
 
 
+def covid_rows(df):
+    """the COVID-19 rows of wrangle_data(), looked up by cause code"""
+    return cause_index.select(
+        df, cause_index.get_cause_index(), code=cause_index.COVID_CODE
+    )
+
+
 def death_rates_by_age_group():
     """Visualize the death rates by age group"""
     # get df for viz
     df = wrangle.wrangle_data()
     # create a pivot table with month as row and age group as column
-    pivot_covid_rate = df[df["cause"].str.contains("#COVID-19")].pivot_table(
-        index="month", columns="age_group", values="crude_rate", aggfunc="sum"
+    pivot_covid_rate = covid_rows(df).pivot_table(
+        index="month",
+        columns="age_group",
+        values="crude_rate",
+        aggfunc="sum",
+        observed=True,
     )
     # create a pivot table with month as row and age group as column
     pivot_all_cause_rate = df.pivot_table(
-        index="month", columns="age_group", values="crude_rate", aggfunc="sum"
+        index="month",
+        columns="age_group",
+        values="crude_rate",
+        aggfunc="sum",
+        observed=True,
     )
     plt.figure(figsize=(10, 6))
     pivot_all_cause_rate.mean().plot(label="all cause")
@@ -38,11 +55,19 @@ def deaths_by_age_group():
     df = wrangle.wrangle_data()
     # create a pivot table with month as row and age group as column
     pivot_all_cause_deaths = df.pivot_table(
-        index="month", columns="age_group", values="deaths", aggfunc="sum"
+        index="month",
+        columns="age_group",
+        values="deaths",
+        aggfunc="sum",
+        observed=True,
     )
     # # create a pivot table with month as row and age group as column
-    pivot_covid_deaths = df[df["cause"].str.contains("#COVID-19")].pivot_table(
-        index="month", columns="age_group", values="deaths", aggfunc="sum"
+    pivot_covid_deaths = covid_rows(df).pivot_table(
+        index="month",
+        columns="age_group",
+        values="deaths",
+        aggfunc="sum",
+        observed=True,
     )
     plt.figure(figsize=(10, 6))
     pivot_all_cause_deaths.sum().plot(label="all cause")
@@ -55,8 +80,12 @@ def deaths_by_age_group_over_time():
     """visulize the deaths by age over time"""
     df = wrangle.wrangle_data()
     # create a pivot table with month as row and age group as column
-    pivot_covid_rate = df[df["cause"].str.contains("#COVID-19")].pivot_table(
-        index="month", columns="age_group", values="crude_rate", aggfunc="sum"
+    pivot_covid_rate = covid_rows(df).pivot_table(
+        index="month",
+        columns="age_group",
+        values="crude_rate",
+        aggfunc="sum",
+        observed=True,
     )
     pivot_covid_rate.plot(figsize=(10, 6))
     # move legend to the top right
@@ -67,11 +96,8 @@ def deaths_by_age_group_over_time():
 
 def top_five_causes_over_time():
     """visualize the top five causes of death over time"""
-    df = wrangle.wrangle_data()
-    # top five causes of death
-    top_five_causes = (
-        df.groupby("cause").sum().sort_values(by="deaths", ascending=False).head(5)
-    )
+    # top five causes of death over the whole span
+    top_five_causes = topn.top_causes(n=5, window="all").set_index("cause")
     sns.barplot(x=top_five_causes.index, y=top_five_causes["deaths"])
     # rotate x labels
     plt.xticks(rotation=90)
@@ -80,20 +106,21 @@ def top_five_causes_over_time():
 
 def top_ten_causes_over_time():
     """visualize the top ten causes of death over time"""
-    df = wrangle.wrangle_data()
-    # top ten causes of death
-    top_ten_causes = (
-        df.groupby("cause").sum().sort_values(by="deaths", ascending=False).head(10)
-    )
-    top_ten_causes["new_crude_rate"] = top_ten_causes.deaths / top_ten_causes.population
+    # top ten causes of death, the rate is per 100,000 of the mean population
+    top_ten_causes = topn.top_causes(n=10, window="all").set_index("cause")
+    top_ten_causes["new_crude_rate"] = top_ten_causes["rate"]
     top_ten_causes.plot(y="new_crude_rate", kind="bar", figsize=(10, 6))
 
 
 def covid_vs_time():
     """visualize the covid deaths vs time"""
     df = wrangle.wrangle_data()
-    pivot_covid_deaths = df[df["cause"].str.contains("#COVID-19")].pivot_table(
-        index="month", columns="age_group", values="deaths", aggfunc="sum"
+    pivot_covid_deaths = covid_rows(df).pivot_table(
+        index="month",
+        columns="age_group",
+        values="deaths",
+        aggfunc="sum",
+        observed=True,
     )
     # add total deaths to pivot table
     pivot_covid_deaths["total_deaths"] = pivot_covid_deaths.sum(axis=1)
@@ -117,9 +144,9 @@ def deaths_by_age_group_with_avg():
     """visualize the deaths by age group with average age"""
     covid_all_ages = wrangle.prep_covid()
     # groupby age and graph age vs death rate
-    covid_all_ages.groupby("age").sum()["deaths"].plot(figsize=(10, 6))
+    covid_all_ages.groupby("age")["deaths"].sum().plot(figsize=(10, 6))
     # spike at 100 is due to 100+ age group is compressed into 1 data point
-    total_deaths = covid_all_ages.groupby("age").sum()["deaths"].sum()
+    total_deaths = covid_all_ages.groupby("age")["deaths"].sum().sum()
     avg_deaths_by_age = total_deaths / 100
     # add line to graph
     plt.axhline(
@@ -137,7 +164,7 @@ def covid_deaths_vs_gender():
     """visualize the covid deaths by gender"""
     covid_all_ages = wrangle.prep_covid()
     # plot the covid deaths vs gender
-    covid_all_ages.groupby("gender").sum()["deaths"].plot(
+    covid_all_ages.groupby("gender", observed=True)["deaths"].sum().plot(
         figsize=(10, 6), kind="bar", title="Covid Deaths by Gender"
     )
     plt.show()
@@ -178,7 +205,7 @@ def monthly_avg_age_all_cause():
 def monthly_avg_age_all_cause():
     """visualize the monthly average age of all cause deaths"""
     df = wrangle.wrangle_data()
-    df.groupby("month").sum()["deaths"].plot(
+    df.groupby("month")["deaths"].sum().plot(
         figsize=(10, 6),
         title="Monthly Average Age of Death from All Causes 2018-Feb 2022",
     )
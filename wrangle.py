@@ -7,6 +7,132 @@ from matplotlib import style
 
 style.use("ggplot")
 import os
+import functools
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import ages
+import snapshot
+
+# source files that sit next to the CDC WONDER yearly exports
+POPULATION_FILE = "population_by_age_and_year.txt"
+COVID_FILE = "covid_deaths_by_age_and_month.txt"
+AGE_DEATHS_FILE = "deaths_by_age_and_month.txt"
+
+# columns of the yearly "Provisional Mortality Statistics" exports
+WONDER_DTYPES = {
+    "Notes": str,
+    "Ten-Year Age Groups": str,
+    "Ten-Year Age Groups Code": str,
+    "Gender": str,
+    "Gender Code": str,
+    "Month": str,
+    "Month Code": str,
+    "UCD - ICD-10 113 Cause List": str,
+    "UCD - ICD-10 113 Cause List Code": str,
+    # float so the footer rows can be read before they are dropped
+    "Deaths": "float64",
+    "Population": str,
+    "Crude Rate": str,
+}
+
+# causes broken out in df2 as (deaths column, scaled column, text in the cause)
+CAUSE_COLUMNS = [
+    ("covid_deaths", "scaled_covid", "COVID-19"),
+    ("heart_related_deaths", "scaled_heart_deaths", "heart"),
+    ("homicide_deaths", "scaled_homicide_deaths", "homicide"),
+    ("suicide_deaths", "scaled_suicide_deaths", "suicide"),
+    ("diabetes_deaths", "scaled_diabetes_deaths", "Diabetes"),
+    ("accident_deaths", "scaled_accident_deaths", "Accident"),
+]
+GENDERS = ["Male", "Female"]
+# age group codes padded so they sort in order
+AGE_CODES = {"1": "01", "1-4": "01-04", "5-14": "05-14"}
+
+# rows per chunk when streaming exports that don't fit in memory
+CHUNKSIZE = 100_000
+
+# set to True to get compact frames (snapshot.compact) from the snapshotted tables
+COMPACT = False
+
+# how many wrangled frames to keep in memory before evicting the oldest
+CACHE_SIZE = 16
+_cache = OrderedDict()
+
+
+def file_fingerprint(paths):
+    """describe each file by its path, size and mtime so edits invalidate the cache"""
+    fingerprint = []
+    for path in sorted(paths):
+        stat = os.stat(path)
+        fingerprint.append((os.path.abspath(path), stat.st_size, stat.st_mtime_ns))
+    return tuple(fingerprint)
+
+
+def cached(sources, persist=False):
+    """cache a loader in memory, keyed on the fingerprint of the files it reads
+
+    sources is a function returning the list of files the loader depends on,
+    with persist=True the result is also kept as an on-disk snapshot so a
+    new process can skip parsing the files. the loader's last_lookup says
+    where the last call found its result: "memory", "snapshot" or "built"
+    """
+
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            fingerprint = file_fingerprint(sources())
+            key = (
+                func.__name__,
+                args,
+                tuple(sorted(kwargs.items())),
+                COMPACT,
+                fingerprint,
+            )
+            if key in _cache:
+                _cache.move_to_end(key)
+                wrapper.last_lookup = "memory"
+            else:
+                # anything built from an older version of the files is stale,
+                # entries of the same files (the other COMPACT setting) are kept
+                for stale in [
+                    old
+                    for old in _cache
+                    if old[0] == func.__name__ and old[-1] != fingerprint
+                ]:
+                    del _cache[stale]
+                df = None
+                wrapper.last_lookup = "snapshot"
+                if persist and not args and not kwargs:
+                    df = snapshot.load_snapshot(func.__name__, fingerprint)
+                if df is None:
+                    wrapper.last_lookup = "built"
+                    df = func(*args, **kwargs)
+                    if persist and not args and not kwargs:
+                        snapshot.save_snapshot(func.__name__, df, fingerprint)
+                # only the snapshotted tables are compacted, not raw inputs
+                # like get_population()
+                if COMPACT and persist:
+                    df = snapshot.compact(df)
+                _cache[key] = df
+                # evict the least recently used frames
+                while len(_cache) > CACHE_SIZE:
+                    _cache.popitem(last=False)
+            # hand out a copy so one plot can't corrupt another's data
+            return _cache[key].copy()
+
+        wrapper.last_lookup = None
+        return wrapper
+
+    return decorator
+
+
+def clear_cache(name=None):
+    """drop cached frames, either all of them or only those of one loader"""
+    if name is None:
+        _cache.clear()
+        return
+    for key in [key for key in _cache if key[0] == name]:
+        del _cache[key]
 
 
 # list all files in this directory with .txt
@@ -18,29 +144,113 @@ def list_files(path):
     return files
 
 
-def make_df():
-    """make a dataframe from the files in the directory"""
-    # get the list of files
-    files = list_files(".")
-    # create a dataframe for all the files
-    df = pd.DataFrame()
-    # run through all the files adding them to the dataframe
+def drop_footer(df):
+    """drop the query notes WONDER appends below the data
+
+    they only fill the Notes column, so they are the rows without a month
+    """
+    return df[df["Month Code"].notna()].astype({"Deaths": "int64"})
+
+
+def read_export(file):
+    """read one yearly WONDER export with the schema declared up front"""
+    return drop_footer(pd.read_csv(file, sep="\t", dtype=WONDER_DTYPES))
+
+
+def read_chunks(file, clean, chunksize=CHUNKSIZE, dtype=str):
+    """read an export a chunk at a time, yielding each chunk cleaned by clean()
+
+    every cleaning step in this module works row by row, so prep_data(),
+    clean_covid() and clean_age_deaths() can be applied to each chunk as is
+    """
+    reader = pd.read_csv(file, sep="\t", dtype=dtype, chunksize=chunksize)
+    for chunk in reader:
+        chunk = clean(chunk)
+        if len(chunk):
+            yield chunk
+
+
+def clean_export(df):
+    """clean a chunk of a yearly export the way make_df() and prep_data() do"""
+    return prep_data(drop_footer(df))
+
+
+def stream_aggregate(files, clean, by, values=("deaths",), chunksize=CHUNKSIZE):
+    """sum values by the columns in by over files read in chunks
+
+    only the running totals are kept, so peak memory is one chunk plus the
+    aggregate however large the exports are. e.g. the monthly cause counts
+    make_df2() needs, without loading the full table:
+
+        stream_aggregate(files, clean_export, ["month", "gender", "cause"])
+    """
+    total = None
     for file in files:
-        df = df.append(pd.read_csv(file, sep="\t"))
-    return df
+        for chunk in read_chunks(file, clean, chunksize):
+            part = chunk.groupby(by, observed=True)[list(values)].sum()
+            total = part if total is None else total.add(part, fill_value=0)
+    if total is None:
+        return None
+    return total.astype("int64").sort_index()
 
 
-def prep_data(df):
-    """prepare the dataframe for plotting"""
-    # remove notes column
-    df = df.drop(columns=["Notes"])
-    # remove all rows with "Data not shown due to 6 month lag to account"
-    df = df[
+def stream_cause_counts(files=None, chunksize=CHUNKSIZE):
+    """monthly_cause_counts() of the yearly exports, streamed chunk by chunk"""
+    if files is None:
+        files = sorted(list_files("."))
+    counts = stream_aggregate(
+        files, clean_export, ["month", "gender", "cause"], chunksize=chunksize
+    )
+    return counts["deaths"].unstack("cause", fill_value=0)
+
+
+def make_df(workers=None):
+    """make a dataframe from the files in the directory"""
+    # get the list of files, sorted so the row order doesn't depend on the os
+    files = sorted(list_files("."))
+    if not files:
+        return pd.DataFrame(columns=list(WONDER_DTYPES))
+    # parse the files in parallel, the csv parser releases the gil while tokenizing
+    workers = workers or min(len(files), os.cpu_count() or 1)
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        frames = list(executor.map(read_export, files))
+    # concatenate once instead of copying the growing frame for every file
+    return pd.concat(frames, ignore_index=True)
+
+
+@cached(lambda: list_files("."), persist=True)
+def get_exports():
+    """the yearly exports of make_df(), from memory or a snapshot when fresh"""
+    return make_df()
+
+
+def drop_lagged(df):
+    """drop the rows WONDER withholds for the 6 month reporting lag"""
+    return df[
         df["UCD - ICD-10 113 Cause List"].str.startswith(
             "Data not shown due to 6 month lag to account"
         )
         == False
     ]
+
+
+def parse_months(months):
+    """WONDER month codes ("2018/01") to datetimes"""
+    if isinstance(months.dtype, pd.CategoricalDtype):
+        # a compacted column, parse each distinct month once
+        codes = months.cat.codes.to_numpy()
+        parsed = parse_months(months.cat.categories.to_series()).to_numpy()
+        return pd.Series(parsed[codes], index=months.index, name=months.name)
+    # an explicit format skips guessing it from the values
+    return pd.to_datetime(months, format="%Y/%m")
+
+
+def prep_data(df):
+    """prepare the dataframe for plotting"""
+    # remove notes column
+    df = df.drop(columns=["Notes"])
+    # remove all rows with "Data not shown due to 6 month lag to account"
+    df = drop_lagged(df)
     # remove redundant columns
     # *** population data is in a different file **
     df = df.drop(
@@ -68,25 +278,23 @@ def prep_data(df):
     df.columns = df.columns.str.replace(" ", "_")
     # deaths to int
     df["deaths"] = df["deaths"].astype(int)
-    # change age_group age group '1' to '01'
-    df.loc[df["age_group"] == "1", "age_group"] = "01"
-    # change age_group age group '1-4' to '01-04'
-    df.loc[df["age_group"] == "1-4", "age_group"] = "01-04"
-    # change age_group age group '5-14' to '05-14'
-    df.loc[df["age_group"] == "5-14", "age_group"] = "05-14"
+    # change age_group age groups '1', '1-4' and '5-14' to '01', '01-04' and
+    # '05-14', as strings so a compacted (categorical) table works too
+    df["age_group"] = df["age_group"].astype(str).replace(AGE_CODES)
     # add a column for the year from month
     df["year"] = df["month"].str[:4]
     # keep data only where cause starts with #
     df = df[df["cause"].str.startswith("#")]  # this keeps only the main groups of death
-    df.month = pd.to_datetime(df.month)
+    df.month = parse_months(df.month)
     # drop 2022/03 due to missing data
     df = df[df.month != "2022/03"]
     return df
 
 
+@cached(lambda: [POPULATION_FILE])
 def get_population():
     """get the population data"""
-    population = pd.read_csv("population_by_age_and_year.txt", sep="\t")
+    population = pd.read_csv(POPULATION_FILE, sep="\t")
     return population
 
 
@@ -130,13 +338,78 @@ def prep_pop_data(df):
     return df
 
 
+def monthly_population(population, months):
+    """population of each (month, age_group, gender) as an array
+
+    the yearly values are mid-year estimates and are interpolated to the middle
+    of each month. WONDER repeats the last estimate for the latest years, those
+    are extrapolated from the trend of the last two real estimates instead.
+    returns a dict with the labels of each axis under "axes" and the array
+    under "population", -1 where a group has no estimate
+    """
+    population = population.assign(
+        population=pd.to_numeric(population["population"], errors="coerce")
+    ).dropna(subset=["population"])
+    yearly = population.pivot(
+        index="year", columns=["age_group", "gender"], values="population"
+    ).sort_index()
+    axes = {
+        "month": pd.DatetimeIndex(np.sort(pd.unique(months)), name="month"),
+        "age_group": pd.Index(sorted(population["age_group"].unique())),
+        "gender": pd.Index(sorted(population["gender"].unique())),
+    }
+    yearly = yearly.reindex(
+        columns=pd.MultiIndex.from_product([axes["age_group"], axes["gender"]])
+    )
+    years = yearly.index.astype(int).to_numpy()
+    values = yearly.to_numpy(dtype="float64")
+    # drop the carried forward years at the end
+    while len(values) > 2 and np.array_equal(values[-1], values[-2], equal_nan=True):
+        years, values = years[:-1], values[:-1]
+    # positions in years, estimates at mid-year and months at mid-month
+    estimates = years + 0.5
+    middles = axes["month"].year + (axes["month"].month - 0.5) / 12
+    if len(years) == 1:
+        table = np.repeat(values, len(middles), axis=0)
+    else:
+        left = np.clip(np.searchsorted(estimates, middles) - 1, 0, len(years) - 2)
+        weight = (middles - estimates[left]) / (estimates[left + 1] - estimates[left])
+        weight = np.asarray(weight)[:, None]
+        table = values[left] * (1 - weight) + values[left + 1] * weight
+    table = np.where(np.isnan(table), -1, np.round(table)).astype("int64")
+    shape = tuple(len(labels) for labels in axes.values())
+    return {"axes": axes, "population": table.reshape(shape)}
+
+
 def merge_data(df, population):
-    """merge the dataframes"""
-    # merge the dataframes
-    df = df.merge(population, on=["year", "age_group", "gender"])
-    return df
+    """add the population of each row's month, age group and gender
 
+    looked up in the monthly_population() array rather than merged, rows with
+    no population estimate are dropped like an inner merge would
+    """
+    table = monthly_population(population, df["month"].unique())
+    codes = []
+    for axis in ["month", "age_group", "gender"]:
+        # look up each distinct label once
+        row_codes, labels = pd.factorize(df[axis])
+        codes.append(table["axes"][axis].get_indexer(labels)[row_codes])
+    found = np.logical_and.reduce([code >= 0 for code in codes])
+    values = np.full(len(df), -1, dtype="int64")
+    values[found] = table["population"][tuple(code[found] for code in codes)]
+    found &= values >= 0
+    return df[found].assign(population=values[found])
+
+
+def add_crude_rate(df):
+    """finish the merged table with a crude death rate"""
+    # make population and int, on a new frame so the joined table is untouched
+    df = df.astype({"population": int})
+    # make a crude rate column
+    df["crude_rate"] = df["deaths"] / df["population"]
+    return snapshot.to_typed(df)
 
+
+@cached(lambda: list_files(".") + [POPULATION_FILE], persist=True)
 def wrangle_data():
     """wrangle the data into the first major df"""
     df = make_df()
@@ -144,16 +417,18 @@ def wrangle_data():
     pop = get_population()
     pop = prep_pop_data(pop)
     df = merge_data(df, pop)
-    # make population and int
-    df["population"] = df["population"].astype(int)
-    # make a crude rate column
-    df["crude_rate"] = df["deaths"] / df["population"]
-    return df
+    return add_crude_rate(df)
 
 
+@cached(lambda: [COVID_FILE], persist=True)
 def prep_covid():
     """prepare the covid data"""
-    df = pd.read_csv("covid_deaths_by_age_and_month.txt", sep="\t")
+    df = pd.read_csv(COVID_FILE, sep="\t", dtype=str)
+    return snapshot.to_typed(clean_covid(df))
+
+
+def clean_covid(df):
+    """clean the covid export, whole or one chunk at a time"""
     # remove redundant columns
     # *** population data is in a different file **
     df = df.drop(
@@ -171,7 +446,8 @@ def prep_covid():
     df.dropna(inplace=True)
     # change the column names to be more readable
     df.rename(
-        columns={"Single-Year Ages": "age", "Month Code": "month"}, inplace=True,
+        columns={"Single-Year Ages": "age", "Month Code": "month"},
+        inplace=True,
     )
     # make all columns lowercase
     df.columns = df.columns.str.lower()
@@ -191,16 +467,22 @@ def prep_covid():
     df.age = df.age.astype(int)
     # make a year column
     df["year"] = df.month.str[:4]
-    df.month = pd.to_datetime(df.month)
+    df.month = parse_months(df.month)
     df["deaths_times_age"] = df["deaths"] * df["age"]
     return df
 
 
+@cached(lambda: [AGE_DEATHS_FILE], persist=True)
 def prep_age_deaths():
     """prepare the age deaths data"""
+    df = pd.read_csv(AGE_DEATHS_FILE, sep="\t", dtype=str)
+    return snapshot.to_typed(clean_age_deaths(df))
+
+
+def clean_age_deaths(df):
+    """clean the deaths by single year of age export, whole or one chunk at a time"""
     # remove redundant columns
     # *** population data is in a different file **
-    df = pd.read_csv("deaths_by_age_and_month.txt", sep="\t")
     df = df.drop(
         columns=[
             "Notes",
@@ -215,7 +497,8 @@ def prep_age_deaths():
     df.dropna(inplace=True)
     # change the column names to be more readable
     df.rename(
-        columns={"Single-Year Ages Code": "age", "Month Code": "month"}, inplace=True,
+        columns={"Single-Year Ages Code": "age", "Month Code": "month"},
+        inplace=True,
     )
     # make all columns lowercase
     df.columns = df.columns.str.lower()
@@ -232,35 +515,38 @@ def prep_age_deaths():
     # make a year column
     df["year"] = df.month.str[:4]
     # convert month to datetime
-    df.month = pd.to_datetime(df.month)
+    df.month = parse_months(df.month)
     # add a column to use later for avg age of death
     df["deaths_times_age"] = df["deaths"] * df["age"]
     return df
 
 
 def get_covid_all_ages():
-    covid_all_ages = prep_covid()
-    covid_all_ages.month = pd.to_datetime(covid_all_ages.month)
-    covid_all_ages["deaths_times_age"] = (
-        covid_all_ages["deaths"] * covid_all_ages["age"]
-    )
-    return covid_all_ages
+    """covid deaths by single year of age, prep_covid() already adds deaths_times_age"""
+    return prep_covid()
+
 
+def get_monthly_deaths(df=None, covid_all_ages=None, cause_counts=None):
+    """get the monthly deaths
 
-def get_monthly_deaths():
-    """get the monthly deaths"""
-    df = wrangle_data()
-    covid_all_ages = get_covid_all_ages()
+    df, covid_all_ages or the monthly_cause_counts() of df can be passed in
+    when the caller already has them
+    """
+    if cause_counts is None:
+        if df is None:
+            df = wrangle_data()
+        cause_counts = monthly_cause_counts(df)
+    if covid_all_ages is None:
+        covid_all_ages = get_covid_all_ages()
+    # deaths and mean age per month from one bincount over (month, age)
+    covid_ages = ages.age_summary(ages.age_histogram(covid_all_ages), quantiles=[])
     monthly_deaths = pd.DataFrame()
-    monthly_deaths["average_covid_death_age"] = (
-        covid_all_ages.groupby("month").sum()["deaths_times_age"]
-        / covid_all_ages.groupby("month").sum()["deaths"]
-    )
-    monthly_deaths["covid_deaths"] = covid_all_ages.groupby("month").sum()["deaths"]
+    monthly_deaths["average_covid_death_age"] = covid_ages["mean_age"]
+    monthly_deaths["covid_deaths"] = covid_ages["deaths"].astype("int64")
     monthly_deaths["scaled_covid"] = (
         monthly_deaths["covid_deaths"] * 100 / monthly_deaths["covid_deaths"].max()
     )
-    monthly_deaths["all_cause_deaths"] = df.groupby("month").sum()["deaths"]
+    monthly_deaths["all_cause_deaths"] = all_cause_deaths(cause_counts)
     monthly_deaths["scaled_all_cause"] = (
         monthly_deaths["all_cause_deaths"]
         * 100
@@ -269,175 +555,110 @@ def get_monthly_deaths():
     return monthly_deaths
 
 
-def make_df2():
-    """make the second major df"""
-    deaths_by_age = prep_age_deaths()
-    df = wrangle_data()
-    monthly_deaths = get_monthly_deaths()
-    df2 = pd.DataFrame()
-    df2["all_cause_deaths"] = df.groupby("month").sum()["deaths"]
-    df2["covid_deaths"] = (
-        df[df.cause.str.contains("COVID-19")].groupby("month").sum()["deaths"]
+def monthly_cause_counts(df):
+    """deaths with a row per (month, gender) and a column per cause
+
+    this small table is the only pass over the full table the monthly
+    aggregates need, everything else in df2 is derived from it
+    """
+    # compact frames hold deaths in a narrow int, sum in 64 bits
+    deaths = df["deaths"].astype("int64")
+    return (
+        deaths.groupby([df["month"], df["gender"], df["cause"]], observed=True)
+        .sum()
+        .unstack("cause", fill_value=0)
     )
-    df2["scaled_covid"] = df2["covid_deaths"] * 100 / df2["covid_deaths"].max()
+
+
+def all_cause_deaths(cause_counts):
+    """total deaths per month from monthly_cause_counts()"""
+    return cause_counts.sum(axis=1).groupby(level="month").sum()
+
+
+def monthly_cause_deaths(cause_counts):
+    """monthly deaths for every cause in CAUSE_COLUMNS, overall and by gender
+
+    each distinct cause of monthly_cause_counts() is matched against the
+    patterns once, so adding a cause doesn't add a scan of the table. columns
+    are the df2 names, prefixed with "male_"/"female_" per gender
+    """
+    # 0/1 matrix of which patterns each distinct cause matches
+    causes = pd.Index(cause_counts.columns.astype(str))
+    patterns = pd.DataFrame(
+        {
+            deaths_col: causes.str.contains(pattern, regex=False)
+            for deaths_col, scaled_col, pattern in CAUSE_COLUMNS
+        },
+        index=cause_counts.columns,
+    ).astype(int)
+    months = cause_counts.index.unique(level="month")
+    counts = {"": cause_counts.groupby(level="month").sum().dot(patterns)}
+    for gender in GENDERS:
+        counts[gender.lower() + "_"] = cause_counts.xs(gender, level="gender").dot(
+            patterns
+        )
+    matrix = {}
+    for prefix, deaths in counts.items():
+        # months without any matching rows stay missing, like a filtered groupby
+        deaths = deaths.reindex(months).where(lambda deaths: deaths > 0)
+        scaled = deaths * 100 / deaths.max()
+        for deaths_col, scaled_col, pattern in CAUSE_COLUMNS:
+            matrix[prefix + deaths_col] = deaths[deaths_col]
+            matrix[prefix + scaled_col] = scaled[deaths_col]
+    return pd.DataFrame(matrix)
+
+
+def make_df2(
+    df=None,
+    deaths_by_age=None,
+    monthly_deaths=None,
+    cause_counts=None,
+    cause_deaths=None,
+):
+    """make the second major df
+
+    any of the upstream tables can be passed in so they are not rebuilt,
+    see pipeline.py for running all the stages once each
+    """
+    if cause_counts is None:
+        if df is None:
+            df = wrangle_data()
+        cause_counts = monthly_cause_counts(df)
+    if deaths_by_age is None:
+        deaths_by_age = prep_age_deaths()
+    if monthly_deaths is None:
+        monthly_deaths = get_monthly_deaths(cause_counts=cause_counts)
+    if cause_deaths is None:
+        cause_deaths = monthly_cause_deaths(cause_counts)
+    df2 = pd.DataFrame()
+    df2["all_cause_deaths"] = all_cause_deaths(cause_counts)
+    df2["covid_deaths"] = cause_deaths["covid_deaths"]
+    df2["scaled_covid"] = cause_deaths["scaled_covid"]
     df2["scaled_all_cause"] = (
         df2["all_cause_deaths"] * 100 / df2["all_cause_deaths"].max()
     )
-    df2["difference"] = df2["scaled_covid"] - df2["scaled_all_cause"]
-    df2["average_death_age"] = (
-        deaths_by_age.groupby("month").sum()["deaths_times_age"]
-        / deaths_by_age.groupby("month").sum()["deaths"]
+    # only defined once covid deaths were recorded, zero before the pandemic
+    df2["difference"] = (df2["scaled_covid"] - df2["scaled_all_cause"]).where(
+        df2["covid_deaths"] > 0
     )
+    df2["average_death_age"] = ages.age_summary(
+        ages.age_histogram(deaths_by_age), quantiles=[]
+    )["mean_age"]
     df2["average_covid_death_age"] = monthly_deaths["average_covid_death_age"]
     df2.fillna(0, inplace=True)  # fills all the prepandemic covid data with zeros
-    df2["heart_related_deaths"] = (
-        df[df.cause.str.contains("heart")].groupby("month").sum()["deaths"]
-    )
-    df2["scaled_heart_deaths"] = (
-        df2["heart_related_deaths"] * 100 / df2["heart_related_deaths"].max()
-    )
-    df2["homicide_deaths"] = (
-        df[df.cause.str.contains("homicide")].groupby("month").sum()["deaths"]
-    )
-    df2["scaled_homicide_deaths"] = (
-        df2["homicide_deaths"] * 100 / df2["homicide_deaths"].max()
-    )
-    df2["suicide_deaths"] = (
-        df[df.cause.str.contains("suicide")].groupby("month").sum()["deaths"]
-    )
-    df2["scaled_suicide_deaths"] = (
-        df2["suicide_deaths"] * 100 / df2["suicide_deaths"].max()
-    )
-    df2["diabetes_deaths"] = (
-        df[df.cause.str.contains("Diabetes")].groupby("month").sum()["deaths"]
-    )
-    df2["scaled_diabetes_deaths"] = (
-        df2["diabetes_deaths"] * 100 / df2["diabetes_deaths"].max()
-    )
-    df2["accident_deaths"] = (
-        df[df.cause.str.contains("Accident")].groupby("month").sum()["deaths"]
-    )
-    df2["scaled_accident_deaths"] = (
-        df2["accident_deaths"] * 100 / df2["accident_deaths"].max()
-    )
-    # make a male death df
-    df_male = df[df.gender == "Male"].copy()
-    # assign month to datetime
-    df_male.month = pd.to_datetime(df_male.month)
-    # repeat for female
-    df_female = df[df.gender == "Female"].copy()
-    df_female.month = pd.to_datetime(df_female.month)
-    # add male deaths
-    df2["male_covid_deaths"] = (
-        df_male[df_male.cause.str.contains("COVID-19")].groupby("month").sum()["deaths"]
-    )
-    df2["male_scaled_covid"] = df2["covid_deaths"] * 100 / df2["covid_deaths"].max()
-    df2["male_covid_deaths"].fillna(
-        0, inplace=True
-    )  # fills all the prepandemic covid data with zeros
-    df2["male_heart_related_deaths"] = (
-        df_male[df_male.cause.str.contains("heart")].groupby("month").sum()["deaths"]
-    )
-    df2["male_scaled_heart_deaths"] = (
-        df2["male_heart_related_deaths"] * 100 / df2["male_heart_related_deaths"].max()
-    )
-    df2["male_homicide_deaths"] = (
-        df_male[df_male.cause.str.contains("homicide")].groupby("month").sum()["deaths"]
-    )
-    df2["male_scaled_homicide_deaths"] = (
-        df2["male_homicide_deaths"] * 100 / df2["male_homicide_deaths"].max()
-    )
-    df2["male_suicide_deaths"] = (
-        df_male[df_male.cause.str.contains("suicide")].groupby("month").sum()["deaths"]
-    )
-    df2["male_scaled_suicide_deaths"] = (
-        df2["male_suicide_deaths"] * 100 / df2["male_suicide_deaths"].max()
-    )
-    df2["male_diabetes_deaths"] = (
-        df_male[df_male.cause.str.contains("Diabetes")].groupby("month").sum()["deaths"]
-    )
-    df2["male_scaled_diabetes_deaths"] = (
-        df2["male_diabetes_deaths"] * 100 / df2["male_diabetes_deaths"].max()
-    )
-    df2["male_accident_deaths"] = (
-        df_male[df_male.cause.str.contains("Accident")].groupby("month").sum()["deaths"]
-    )
-    df2["male_scaled_accident_deaths"] = (
-        df2["male_accident_deaths"] * 100 / df2["male_accident_deaths"].max()
-    )
-    # list of columns where name contains 'scaled'
-    male_scaled_cols = [
-        col for col in df2.columns if ("male" in col) and ("scaled" in col)
-    ]
-    # list cols where deaths in name bad scaled is not
-    male_deaths_cols = [
-        col
-        for col in df2.columns
-        if ("male" in col) and ("deaths" in col) and ("scaled" not in col)
-    ]
-
-    # add female deaths
-    df2["female_covid_deaths"] = (
-        df_female[df_female.cause.str.contains("COVID-19")]
-        .groupby("month")
-        .sum()["deaths"]
-    )
-    df2["female_scaled_covid"] = df2["covid_deaths"] * 100 / df2["covid_deaths"].max()
-    df2["female_covid_deaths"].fillna(
-        0, inplace=True
-    )  # fills all the prepandemic covid data with zeros
-    df2["female_heart_related_deaths"] = (
-        df_female[df_female.cause.str.contains("heart")]
-        .groupby("month")
-        .sum()["deaths"]
-    )
-    df2["female_scaled_heart_deaths"] = (
-        df2["female_heart_related_deaths"]
-        * 100
-        / df2["female_heart_related_deaths"].max()
-    )
-    df2["female_homicide_deaths"] = (
-        df_female[df_female.cause.str.contains("homicide")]
-        .groupby("month")
-        .sum()["deaths"]
-    )
-    df2["female_scaled_homicide_deaths"] = (
-        df2["female_homicide_deaths"] * 100 / df2["female_homicide_deaths"].max()
-    )
-    df2["female_suicide_deaths"] = (
-        df_female[df_female.cause.str.contains("suicide")]
-        .groupby("month")
-        .sum()["deaths"]
-    )
-    df2["female_scaled_suicide_deaths"] = (
-        df2["female_suicide_deaths"] * 100 / df2["female_suicide_deaths"].max()
-    )
-    df2["female_diabetes_deaths"] = (
-        df_female[df_female.cause.str.contains("Diabetes")]
-        .groupby("month")
-        .sum()["deaths"]
-    )
-    df2["female_scaled_diabetes_deaths"] = (
-        df2["female_diabetes_deaths"] * 100 / df2["female_diabetes_deaths"].max()
-    )
-    df2["female_accident_deaths"] = (
-        df_female[df_female.cause.str.contains("Accident")]
-        .groupby("month")
-        .sum()["deaths"]
-    )
-    df2["female_scaled_accident_deaths"] = (
-        df2["female_accident_deaths"] * 100 / df2["female_accident_deaths"].max()
-    )
-    # list of columns where name contains 'scaled'
-    female_scaled_cols = [
-        col for col in df2.columns if ("female" in col) and ("scaled" in col)
-    ]
-    # list cols where deaths in name bad scaled is not
-    female_deaths_cols = [
-        col
-        for col in df2.columns
-        if ("female" in col) and ("deaths" in col) and ("scaled" not in col)
+    # the remaining causes, then the same for each gender
+    df2 = df2.join(cause_deaths.drop(columns=["covid_deaths", "scaled_covid"]))
+    # fills the prepandemic gendered covid data with zeros
+    covid_cols = [
+        gender.lower() + "_" + col
+        for gender in GENDERS
+        for col in ["covid_deaths", "scaled_covid"]
     ]
+    df2[covid_cols] = df2[covid_cols].fillna(0)
+    male_scaled_cols = ["male_" + scaled_col for _, scaled_col, _ in CAUSE_COLUMNS]
+    male_deaths_cols = ["male_" + deaths_col for deaths_col, _, _ in CAUSE_COLUMNS]
+    female_scaled_cols = ["female_" + scaled_col for _, scaled_col, _ in CAUSE_COLUMNS]
+    female_deaths_cols = ["female_" + deaths_col for deaths_col, _, _ in CAUSE_COLUMNS]
     return (
         df2,
         male_scaled_cols,